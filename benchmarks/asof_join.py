@@ -0,0 +1,83 @@
+"""
+Point-in-time join benchmark: builds a synthetic repository with one commit
+per simulated day, then times `asof_join` with the as-of logic in SQL and
+client-side with `merge_asof`.
+
+    python benchmarks/asof_join.py --commits 2000 --keys 100 --labels 5000
+"""
+import argparse
+import datetime
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from doltcli import Dolt
+
+from dolt_integrations.utils import asof_join, write_pandas
+from dolt_integrations.utils.utils import execute_sql_script
+
+
+def build_repo(path: str, commits: int, keys: int, labels: int, seed: int = 0) -> Dolt:
+    rng = np.random.default_rng(seed)
+    db = Dolt.init(path)
+    write_pandas(
+        db,
+        "features",
+        pd.DataFrame({"id": np.arange(keys), "value": np.zeros(keys)}),
+        primary_key=["id"],
+    )
+    db.add("features")
+    start = datetime.datetime(2020, 1, 1)
+    db.commit("day 0", date=start)
+
+    # one dolt sql process for all commits, each touching a few keys
+    statements = []
+    for day in range(1, commits):
+        ids = rng.choice(keys, size=max(1, keys // 10), replace=False)
+        values = ", ".join(f"({i}, {rng.random():.6f})" for i in ids)
+        date = (start + datetime.timedelta(days=day)).isoformat()
+        statements.append(
+            f"REPLACE INTO features (id, value) VALUES {values};\n"
+            f"CALL dolt_commit('-am', 'day {day}', '--date', '{date}');"
+        )
+    execute_sql_script(db, "\n".join(statements))
+
+    offsets = rng.integers(0, commits * 24 * 3600, size=labels)
+    write_pandas(
+        db,
+        "labels",
+        pd.DataFrame(
+            {
+                "label_id": np.arange(labels),
+                "id": rng.integers(0, keys, size=labels),
+                "ts": start + pd.to_timedelta(offsets, unit="s"),
+            }
+        ),
+        primary_key=["label_id"],
+    )
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commits", type=int, default=2000)
+    parser.add_argument("--keys", type=int, default=100)
+    parser.add_argument("--labels", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        start = time.perf_counter()
+        db = build_repo(path, args.commits, args.keys, args.labels)
+        print(f"built {args.commits} commits in {time.perf_counter() - start:.1f}s")
+
+        for in_sql in (True, False):
+            start = time.perf_counter()
+            res = asof_join(db, "labels", "features", ["id"], "ts", in_sql=in_sql)
+            elapsed = time.perf_counter() - start
+            mode = "sql" if in_sql else "merge_asof"
+            print(f"{mode:>10}: {elapsed:.2f}s, {len(res)} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Column read benchmark: builds a table of `--rows` rows, then reads two
+columns with `read_numpy` and with `read_columns_sql` plus `np.array`, the
+path the fashion-mnist example used.
+
+    python benchmarks/read_numpy.py --rows 10000000
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from doltcli import Dolt, read_columns_sql
+
+from dolt_integrations.utils import read_numpy, write_pandas
+
+QUERY = "select label, score from samples"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        db = Dolt.init(path)
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame(
+            {
+                "row_id": np.arange(args.rows),
+                "label": rng.integers(0, 10, size=args.rows),
+                "score": rng.random(args.rows),
+            }
+        )
+        start = time.perf_counter()
+        write_pandas(db, "samples", df, primary_key=["row_id"])
+        print(f"wrote {args.rows} rows in {time.perf_counter() - start:.1f}s")
+        del df
+
+        start = time.perf_counter()
+        columns = read_columns_sql(db, QUERY)
+        label = np.array(columns["label"]).astype(np.int32)
+        score = np.array(columns["score"]).astype(np.float64)
+        print(f"read_columns_sql: {time.perf_counter() - start:.2f}s")
+        del columns, label, score
+
+        start = time.perf_counter()
+        read_numpy(db, QUERY, dtypes={"label": np.int32, "score": np.float64})
+        print(f"      read_numpy: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ from .interface import (
     Branch,
     CallbackMeta,
     DoltMeta,
+    DoltSession,
     load,
     Meta,
     MergeBranch,
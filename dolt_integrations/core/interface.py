@@ -1,26 +1,91 @@
 from contextlib import contextmanager
 import datetime
-from dataclasses_json import dataclass_json
 from dataclasses import asdict, dataclass, field
+import hashlib
 import json
+import os
 
 from typing import Callable, Optional
 
 import doltcli as dolt # typing: ignore
 
+from dolt_integrations.utils.lock import branch_lock, repo_lock
+from dolt_integrations.utils.maintenance import maintain
+from dolt_integrations.utils.stats import check_read_budget, table_stats
+from dolt_integrations.utils.session import BranchSession, DoltSession
+from dolt_integrations.utils.utils import (
+    CREATE,
+    REPLACE,
+    get_fingerprint,
+    insert_pandas,
+    set_fingerprint,
+)
+
+
+def dataclass_json(cls):
+    """
+    Lazy stand-in for `dataclasses_json.dataclass_json`. The real decorator
+    (and the marshmallow import chain behind it) is only applied the first
+    time one of the (de)serialization methods is called.
+    """
+
+    def bind():
+        from dataclasses_json import dataclass_json as _dataclass_json
+
+        return _dataclass_json(cls)
+
+    def method(name):
+        def inner(self, *args, **kwargs):
+            bind()
+            return getattr(self, name)(*args, **kwargs)
+
+        return inner
+
+    def class_method(name):
+        def inner(klass, *args, **kwargs):
+            bind()
+            return getattr(klass, name)(*args, **kwargs)
+
+        return classmethod(inner)
+
+    for name in ("to_json", "to_dict"):
+        setattr(cls, name, method(name))
+    for name in ("from_json", "from_dict", "schema"):
+        setattr(cls, name, class_method(name))
+    return cls
+
 
 class Branch:
-    @contextmanager
-    def __call__(self, db: dolt.Dolt):
-        starting_head = db.head
-        starting_branch = db.active_branch
+    session: bool = False
 
-        try:
-            self.checkout(db)
-            yield db
-        finally:
-            self.merge(db, starting_branch)
-            db.checkout(starting_branch, error=False)
+    @contextmanager
+    def __call__(self, db: dolt.Dolt, write: bool = False):
+        """
+        Context over the configured branch. With `session`, the repository
+        lock is only held shared, since revision database sessions leave the
+        checkout alone; writes (`write`, or creating the branch) take the
+        branch's own lock exclusive, reads take it shared.
+        """
+        if self.session:
+            with repo_lock(db.repo_dir).shared():
+                lock = branch_lock(db.repo_dir, self.branch)
+                creates = self.head(db) is None
+                acquire = lock.exclusive if write or creates else lock.shared
+                with acquire():
+                    yield self.open_session(db)
+            return
+
+        # checkouts are global to the working directory
+        with repo_lock(db.repo_dir).exclusive():
+            session = DoltSession.of(db)
+            starting_branch = session.active_branch
+
+            try:
+                self.checkout(session)
+                yield session
+            finally:
+                self.merge(session, starting_branch)
+                session.checkout(starting_branch, error=False)
 
     def checkout(self, db: dolt.Dolt):
         raise NotImplemented
@@ -28,6 +93,23 @@ class Branch:
     def merge(self, db: dolt.Dolt, starting_branch: str):
         raise NotImplemented
 
+    def open_session(self, db: dolt.Dolt) -> BranchSession:
+        raise NotImplemented
+
+    def head(self, db: dolt.Dolt) -> Optional[str]:
+        """
+        Commit the context would check out, resolved without a checkout;
+        None when that cannot be known up front.
+        """
+        return None
+
+
+def branch_head(db: dolt.Dolt, branch: str) -> Optional[str]:
+    res = db.sql(
+        f"select hash from dolt_branches where name = '{branch}'", result_format="csv"
+    )
+    return res[0]["hash"] if len(res) > 0 else None
+
 
 @dataclass_json
 @dataclass
@@ -47,32 +129,46 @@ class MergeBranch(Branch):
 @dataclass
 class SerialBranch(Branch):
     branch: str = "master"
+    session: bool = False
     _type: str = "SerialBranch"
 
     def checkout(self, db: dolt.Dolt):
         # branch must exist
         db.checkout(branch=self.branch, error=False)
 
+    def open_session(self, db: dolt.Dolt) -> BranchSession:
+        return BranchSession(db.repo_dir, self.branch)
+
     def merge(self, db: dolt.Dolt, starting_branch: str):
         pass
 
+    def head(self, db: dolt.Dolt) -> Optional[str]:
+        return branch_head(db, self.branch)
+
 
 @dataclass_json
 @dataclass
 class NewBranch(Branch):
     branch: str
+    session: bool = False
     _type: str = "NewBranch"
 
     def checkout(self, db: dolt.Dolt):
-        res = db.sql(f"select * from dolt_branches where name = '{self.branch}'", result_format="csv")
-        if len(res) == 0:
-            db.sql(f"select dolt_checkout('-b', '{self.branch}')", result_format="csv")
-        else:
-            db.sql(f"select dolt_checkout('{self.branch}')", result_format="csv")
+        session = DoltSession.of(db)
+        session.sql_checkout(self.branch, create=self.branch not in session.branches)
+
+    def open_session(self, db: dolt.Dolt) -> BranchSession:
+        # under the branch's exclusive lock, so only one context creates it
+        if branch_head(db, self.branch) is None:
+            db.sql(f"call dolt_branch('{self.branch}')", result_format="csv")
+        return BranchSession(db.repo_dir, self.branch)
 
     def merge(self, db: dolt.Dolt, starting_branch: str):
         pass
 
+    def head(self, db: dolt.Dolt) -> Optional[str]:
+        return branch_head(db, self.branch)
+
 
 @dataclass_json
 @dataclass
@@ -105,8 +201,8 @@ class DoltMeta(Meta):
 
     def create(self, a: Action):
         branch_config = self.branch_config or SerialBranch(branch=self.db.active_branch)
-        with branch_config(self.db):
-            tables = self.db.sql(
+        with branch_config(self.db, write=True) as db:
+            tables = db.sql(
                 f"select * from information_schema.tables where table_name = '{self.tablename}'",
                 result_format="csv",
             )
@@ -125,9 +221,9 @@ class DoltMeta(Meta):
                         primary key (kind, to_commit, tablename, timestamp, context_id)
                     )
                 """
-                self.db.sql(create_table, result_format="csv")
+                db.sql(create_table, result_format="csv")
 
-            self.db.sql(
+            db.sql(
                 f"""
                     insert into
                     {self.tablename} (kind, filename, branch, from_commit, to_commit, tablename, timestamp, context_id)
@@ -192,6 +288,10 @@ class Remote:
 def dolt_export_csv(
     db: dolt.Dolt, tablename: str, filename: str, load_args: dict = None
 ):
+    if isinstance(db, BranchSession):
+        # `table export` only sees the checked out branch
+        return dolt_sql_to_csv(db, f"select * from `{tablename}`", filename, load_args)
+
     exp = ["table", "export", "-f", "--file-type", "csv", tablename, filename]
     db.execute(exp)
 
@@ -208,6 +308,9 @@ def dolt_sql_to_csv(
 def dolt_import_csv(
     db: dolt.Dolt, tablename: str, filename: str, save_args: dict = None
 ):
+    if isinstance(db, BranchSession):
+        return dolt_insert_csv(db, tablename, filename, save_args)
+
     mode = "-c"
     tables = db.ls()
     for t in tables:
@@ -226,6 +329,82 @@ def dolt_import_csv(
     db.execute(imp)
 
 
+MANIFEST_SUFFIX = ".dolt.json"
+
+
+def manifest_path(filename: str) -> str:
+    return f"{filename}{MANIFEST_SUFFIX}"
+
+
+def file_checksum(filename: str) -> str:
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def save_fingerprint(filename: str, save_args: Optional[dict] = None) -> str:
+    """
+    Fingerprint of saving `filename` with `save_args`, which change what
+    the same file imports as.
+    """
+    h = hashlib.sha256(file_checksum(filename).encode("utf-8"))
+    h.update(json.dumps(save_args or {}, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def read_manifest(filename: str) -> Optional[dict]:
+    try:
+        with open(manifest_path(filename), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(filename: str, manifest: dict):
+    with open(manifest_path(filename), "w") as f:
+        json.dump(manifest, f, default=str)
+
+
+def cached_load(filename: str, request: dict, commit: Optional[str]) -> Optional[dict]:
+    """
+    Manifest of a previous export of the same request at `commit`, if
+    `filename` still holds exactly what that export wrote.
+    """
+    manifest = read_manifest(filename)
+    if commit is None or manifest is None or not os.path.exists(filename):
+        return None
+    if manifest.get("commit") != commit:
+        return None
+    if any(manifest.get(k) != v for k, v in request.items()):
+        return None
+    if manifest.get("checksum") != file_checksum(filename):
+        return None
+    return manifest
+
+
+def dolt_insert_csv(
+    db: BranchSession, tablename: str, filename: str, save_args: dict = None
+):
+    """
+    Session-scoped equivalent of `dolt_import_csv`, writing the file with
+    SQL inserts since `table import` cannot target another branch.
+    """
+    import pandas as pd
+
+    tables = [list(r.values())[0] for r in db.sql("show tables", result_format="csv")]
+    pks = (save_args or {}).get("primary_key")
+    pks = [pks] if isinstance(pks, str) else pks
+    insert_pandas(
+        db,
+        tablename,
+        pd.read_csv(filename),
+        import_mode=REPLACE if tablename in tables else CREATE,
+        primary_key=pks,
+    )
+
+
 def parse_branch_conf(conf):
     if not isinstance(conf, Branch):
         try:
@@ -247,12 +426,21 @@ def load(
     meta_conf: Optional[Meta]= None,
     remote_conf: Optional[Remote] = None,
     branch_conf: Optional[Branch] = None,
+    force: bool = False,
+    max_bytes: Optional[int] = None,
 ):
     """
     db remote pattern with context
     db checkout pattern with branch context
     load data into csv, return filepath
     metadata context needs current branch
+
+    A manifest written next to `filename` records the commit and request of
+    the export; if the branch head has not moved and the file is unchanged,
+    the export is skipped, though the load is still recorded with
+    `meta_conf`. `force` always re-exports. With `max_bytes`, a table estimated to take
+    more memory than that once read (see `table_stats`) raises
+    `ReadBudgetExceeded` instead of being exported.
     """
     if tablename is not None and sql is not None:
         raise ValueError("Specify one of: tablename, qury")
@@ -262,13 +450,31 @@ def load(
     if remote_conf is not None:
         remote_conf.pull(db)
 
+    request = dict(tablename=tablename, sql=sql, format="csv", load_args=load_args)
+    if not force:
+        cached = cached_load(filename, request, branch_conf.head(db))
+        if cached is not None:
+            return action_meta(
+                tablename=tablename,
+                sql=sql,
+                filename=filename,
+                from_commit=cached["commit"],
+                to_commit=cached["commit"],
+                branch=cached["branch"],
+                kind="load",
+                meta_conf=meta_conf,
+            )
+
     with branch_conf(db) as chk_db:
         if tablename is not None:
+            if max_bytes is not None:
+                stats = table_stats(chk_db, tablename, chk_db.head)
+                check_read_budget(stats, max_bytes)
             dolt_export_csv(
-                db=db, tablename=tablename, filename=filename, load_args=load_args
+                db=chk_db, tablename=tablename, filename=filename, load_args=load_args
             )
         elif sql is not None:
-            dolt_sql_to_csv(db=db, sql=sql, filename=filename, load_args=load_args)
+            dolt_sql_to_csv(db=chk_db, sql=sql, filename=filename, load_args=load_args)
 
         commit = chk_db.head
         branch = chk_db.active_branch
@@ -284,6 +490,16 @@ def load(
         meta_conf=meta_conf,
     )
 
+    write_manifest(
+        filename,
+        dict(
+            request,
+            commit=commit,
+            branch=branch,
+            checksum=file_checksum(filename),
+        ),
+    )
+
     if remote_conf is not None:
         remote_conf.push(db)
 
@@ -308,27 +524,36 @@ def save(
     branch merge
     record action metadata (after merge b/c we care about persisted state)
     remote push
+
+    The file's checksum and `save_args` are stored with the table; when the
+    same file is saved again the same way onto an unchanged table, the
+    import and commit are skipped.
     """
     branch_conf = parse_branch_conf(branch_conf)
 
     if remote_conf is not None:
         remote_conf.pull(db)
 
-    with branch_conf(db) as chk_db:
+    fingerprint = save_fingerprint(filename, save_args)
+    with branch_conf(db, write=True) as chk_db:
         from_commit = chk_db.head
+        to_commit = from_commit
 
-        dolt_import_csv(
-            db=db, tablename=tablename, filename=filename, save_args=save_args
-        )
-
-        chk_db.sql(f"select dolt_add('.')", result_format="csv")
-        status = chk_db.sql("select * from dolt_status", result_format="csv")
-        if len(status) > 0:
-            chk_db.sql(f"select dolt_commit('-m', '{commit_message}')", result_format="csv")
+        if get_fingerprint(chk_db, tablename) != fingerprint:
+            dolt_import_csv(
+                db=chk_db, tablename=tablename, filename=filename, save_args=save_args
+            )
+            set_fingerprint(chk_db, tablename, fingerprint)
 
-        to_commit = chk_db.head
+            chk_db.sql(f"call dolt_add('.')", result_format="csv")
+            status = chk_db.sql("select * from dolt_status", result_format="csv")
+            if len(status) > 0:
+                to_commit = chk_db.sql_commit(commit_message)
         branch = chk_db.active_branch
 
+    if to_commit != from_commit:
+        maintain(db)
+
     meta = action_meta(
         tablename=tablename,
         filename=filename,
@@ -0,0 +1 @@
+from .dolt import fingerprint, query_hash, table_hash, write_fingerprint
@@ -0,0 +1,41 @@
+import argparse
+
+from doltcli import Dolt
+
+from .dolt import write_fingerprint
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m dolt_integrations.dvc",
+        description="Write a Dolt version file for use as a DVC dependency or output",
+    )
+    parser.add_argument("database", help="Dolt database directory")
+    parser.add_argument("out", help="version file to write")
+    parser.add_argument("--table", action="append", default=[], dest="tables")
+    parser.add_argument(
+        "--query",
+        action="append",
+        default=[],
+        dest="queries",
+        metavar="NAME=SQL",
+        help="named query, versioned by --query-table hashes or the commit",
+    )
+    parser.add_argument("--query-table", action="append", dest="query_tables")
+    parser.add_argument("--commit", help="default: HEAD")
+    args = parser.parse_args()
+
+    queries = dict(q.split("=", 1) for q in args.queries)
+    changed = write_fingerprint(
+        args.out,
+        Dolt(args.database),
+        tables=args.tables,
+        queries=queries,
+        query_tables=args.query_tables,
+        commit=args.commit,
+    )
+    print(f"{args.out} {'updated' if changed else 'unchanged'}")
+
+
+if __name__ == "__main__":
+    main()
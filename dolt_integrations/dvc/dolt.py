@@ -0,0 +1,104 @@
+"""
+Dolt tables and queries as DVC dependencies and outputs. A small JSON file
+records the content hash of each table, computed by Dolt without exporting
+rows, and DVC tracks that file instead of CSV exports:
+
+    stages:
+      labels-version:
+        cmd: python -m dolt_integrations.dvc data/labels labels.dolt.json --table labels
+        always_changed: true
+        outs:
+          - labels.dolt.json:
+              cache: false
+      train:
+        cmd: python train.py
+        deps:
+          - labels.dolt.json
+
+The version stage runs on every `dvc repro` but only reads table hashes.
+Its output is byte-identical while the tables are unchanged, so `train` is
+up to date even after unrelated commits.
+"""
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+from doltcli import Dolt
+
+from dolt_integrations.utils import BranchSession
+
+FINGERPRINT_VERSION = 1
+
+
+def table_hash(db: Dolt, table: str, commit: Optional[str] = None) -> str:
+    """
+    Content hash of `table` at `commit` (default: HEAD), read through the
+    commit's revision database so uncommitted changes are not included.
+    """
+    session = BranchSession(db.repo_dir, commit or db.head)
+    res = session.sql(
+        f"select dolt_hashof_table('{table}') as hash", result_format="csv"
+    )
+    return res[0]["hash"]
+
+
+def query_hash(
+    db: Dolt,
+    query: str,
+    tables: Optional[List[str]] = None,
+    commit: Optional[str] = None,
+) -> str:
+    """
+    Hash of `query` and the data it reads: the hashes of `tables` when
+    given, otherwise the commit itself.
+    """
+    commit = commit or db.head
+    basis = [table_hash(db, t, commit) for t in sorted(tables)] if tables else [commit]
+    return hashlib.sha256("\n".join([query] + basis).encode("utf-8")).hexdigest()
+
+
+def fingerprint(
+    db: Dolt,
+    tables: Optional[List[str]] = None,
+    queries: Optional[Dict[str, str]] = None,
+    query_tables: Optional[List[str]] = None,
+    commit: Optional[str] = None,
+) -> dict:
+    """
+    Versions of `tables` and of named `queries` at `commit`. Commit hashes
+    are deliberately left out so unrelated commits do not change it.
+
+    :param db:
+    :param tables: tables tracked by content hash
+    :param queries: name -> query
+    :param query_tables: tables the queries read, default the whole commit
+    :param commit: default HEAD
+    :return:
+    """
+    commit = commit or db.head
+    return dict(
+        version=FINGERPRINT_VERSION,
+        tables={t: table_hash(db, t, commit) for t in tables or []},
+        queries={
+            name: query_hash(db, query, query_tables, commit)
+            for name, query in (queries or {}).items()
+        },
+    )
+
+
+def write_fingerprint(path: str, db: Dolt, **kwargs) -> bool:
+    """
+    Write `fingerprint(db, **kwargs)` to `path` for DVC to hash, leaving the
+    file untouched when it already holds the same versions. Returns whether
+    it was written.
+    """
+    data = json.dumps(fingerprint(db, **kwargs), indent=2, sort_keys=True) + "\n"
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            if f.read() == data:
+                return False
+
+    with open(path, "w") as f:
+        f.write(data)
+    return True
@@ -3,26 +3,26 @@ import gzip
 import os
 
 import doltcli as dolt
+from dolt_integrations.utils import read_numpy, write_pandas
 import numpy as np
+import pandas as pd
 import tensorflow as tf
 import keras
 
 def get_data(label_path, image_path):
     # get labels from Dolt database
     labeldb = dolt.Dolt(label_path)
-    train_labels_sorted = dolt.read_columns_sql(
+    train_labels = read_numpy(
         labeldb,
         "select label from labels where train = 1 order by row_id",
+        dtypes={"label": np.int32},
     )["label"]
-    test_labels_sorted = dolt.read_columns_sql(
+    test_labels = read_numpy(
         labeldb,
         "select label from labels where train = 0 order by row_id",
+        dtypes={"label": np.int32},
     )["label"]
 
-    # type-convert labels
-    train_labels = np.array(train_labels_sorted).astype(np.int32)
-    test_labels = np.array(test_labels_sorted).astype(np.int32)
-
     # constants for restoring image shapes
     image_size = 28
     train_num = 60000
@@ -88,12 +88,12 @@ def train():
     predictions = np.argmax(probability_model.predict(test_images), axis=1)
 
     # record outputs
-    outputs = dict(
-        row_id=range(len(train_labels), len(train_labels)+len(test_labels)),
-        pred=predictions.tolist(),
-        actual=test_labels.tolist(),
-    )
-    dolt.write_columns(preddb, "predictions", outputs, primary_key=["row_id"])
+    outputs = pd.DataFrame(dict(
+        row_id=np.arange(len(train_labels), len(train_labels)+len(test_labels)),
+        pred=predictions,
+        actual=test_labels,
+    ))
+    write_pandas(preddb, "predictions", outputs, primary_key=["row_id"])
 
     ts = datetime.datetime.now()
     label_branch = labeldb.sql("select active_branch() as ab", result_format="csv")[0]["ab"]
@@ -103,8 +103,8 @@ def train():
         timestamp=ts,
         label_branch=label_branch,
     )
-    dolt.write_rows(preddb, "summary", [summary], primary_key=["timestamp"])
-    preddb.sql(f"select dolt_commit('-am', 'New workflow run at {ts}')")
+    write_pandas(preddb, "summary", pd.DataFrame([summary]), primary_key=["timestamp"])
+    preddb.sql(f"call dolt_commit('-am', 'New workflow run at {ts}')")
 
 if __name__=="__main__":
     train()
@@ -1 +1,7 @@
-from .dolt import DoltDT, DoltConfig, detach_head
+from .dolt import (
+    DoltDT,
+    DoltConfig,
+    detach_head,
+    dolt_step,
+    prune_detached_branches,
+)
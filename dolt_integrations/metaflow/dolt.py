@@ -1,49 +1,133 @@
-from contextlib import contextmanager
-from dataclasses import dataclass, field, replace
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field, fields, replace
 from functools import wraps
 import hashlib
 import json
 import logging
+import re
+import sys
+import threading
 import time
-from typing import Dict, List, Optional, Union
+import zlib
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 import uuid
 import os
 
 from dolt_integrations.utils import read_pandas_sql, write_pandas
-import pandas as pd
+from dolt_integrations.utils.commits import (
+    commit_in_background,
+    drain_commits,
+    enqueue_commit,
+    wait_for_commits,
+)
+from dolt_integrations.utils.lock import repo_lock
+from dolt_integrations.utils.maintenance import maintain
+from dolt_integrations.utils.session import BranchSession, MultiDatabaseSession
+from dolt_integrations.utils.stats import check_read_budget, table_stats
+from dolt_integrations.utils.utils import (
+    FINGERPRINT_TABLE,
+    DtypePolicy,
+    aggregate_pandas_sql,
+    apply_dtype_policy,
+    get_column_types,
+    get_fingerprint,
+    get_sql_literals,
+    read_pandas_chunks,
+    pandas_fingerprint,
+    set_fingerprint,
+)
 
 from doltcli import Dolt, DoltException
 from doltcli import read_rows_sql
-from metaflow import FlowSpec, Run
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from metaflow import FlowSpec, Run
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
+
+# serializes artifact stores, which deferred commits make from worker threads
+_artifact_lock = threading.Lock()
 DOLT_METAFLOW_ACTIONS = "metaflow_actions"
+LOOKUP_BATCH_SIZE = 1000
+DETACHED_PREFIX = "detached_HEAD_at_"
+PRUNE_BATCH_SIZE = 100
+# pandas aggregation -> SQL function Dolt evaluates; others run client-side
+SQL_AGGREGATES = {
+    "count": "COUNT",
+    "sum": "SUM",
+    "mean": "AVG",
+    "min": "MIN",
+    "max": "MAX",
+}
 
 
 @contextmanager
 def detach_head(db, commit):
-    active_branch, _ = db._get_branches()
-    switched = False
-    try:
-        commit_branches = db.sql(
-            f"select name, hash from dolt_branches where hash = '{commit}'",
-            result_format="csv",
-        )
-        if len(commit_branches) > 0:
-            tmp_branch = commit_branches[0]
-            if active_branch.hash != tmp_branch["hash"]:
-                swtiched = True
-                db.checkout(tmp_branch["name"])
+    """
+    Check out `commit` for the duration of the context. A branch already at
+    the commit is reused, preferring a real branch to a temporary one left
+    behind earlier; otherwise a temporary `detached_HEAD_at_<commit>` branch
+    is created. Temporary branches are deleted on exit.
+    """
+    with repo_lock(db.repo_dir).exclusive():
+        active_branch, _ = db._get_branches()
+        if active_branch.hash == commit:
             yield db
+            return
+
+        names = [
+            r["name"]
+            for r in db.sql(
+                f"select name from dolt_branches where hash = '{commit}'",
+                result_format="csv",
+            )
+        ]
+        real = [n for n in names if not n.startswith(DETACHED_PREFIX)]
+        tmp_branch = (real or names or [f"{DETACHED_PREFIX}{commit}"])[0]
+        if names:
+            db.checkout(tmp_branch)
         else:
-            tmp_branch = f"detached_HEAD_at_{commit[:5]}"
             db.checkout(branch=tmp_branch, start_point=commit, checkout_branch=True)
-            switched = True
+
+        try:
             yield db
-    finally:
-        if switched:
+        finally:
             db.checkout(active_branch.name)
+            if tmp_branch.startswith(DETACHED_PREFIX):
+                db.branch(tmp_branch, delete=True, force=True)
+
+
+def prune_detached_branches(db: Dolt, batch_size: int = PRUNE_BATCH_SIZE) -> List[str]:
+    """
+    Delete the temporary branches `detach_head` left behind in processes
+    that exited before cleaning up, other than a checked out one. Returns
+    the deleted branch names.
+    """
+    with repo_lock(db.repo_dir).exclusive():
+        active_branch, _ = db._get_branches()
+        names = [
+            r["name"]
+            for r in db.sql("select name from dolt_branches", result_format="csv")
+            if r["name"].startswith(DETACHED_PREFIX) and r["name"] != active_branch.name
+        ]
+        for i in range(0, len(names), batch_size):
+            db.execute(["branch", "-d", "-f"] + names[i : i + batch_size])
+    if names:
+        logger.info(f"Pruned {len(names)} detached HEAD branches in {db.repo_dir}")
+    return names
 
 
 @dataclass
@@ -59,9 +143,14 @@ class DoltAction:
     pathspec: str
     table_name: str = None
     commit: str = Optional[None]
+    from_commit: Optional[str] = None  # start of the range for change reads
     kind: str = "read"
     query: str = None
     artifact_name: str = None
+    aggregate: Optional[dict] = None  # group_by/aggs applied client-side to query
+    lookup: Optional[dict] = None  # key columns and keys the result is aligned to
+    databases: Optional[Dict[str, str]] = None  # query placeholder -> config id
+    commit_token: Optional[str] = None  # in the message of a deferred commit
     timestamp: float = field(default_factory=lambda: time.time())
 
     def dict(self):
@@ -73,7 +162,12 @@ class DoltAction:
             kind=self.kind,
             query=self.query,
             commit=self.commit,
+            from_commit=self.from_commit,
             artifact_name=self.artifact_name,
+            aggregate=self.aggregate,
+            lookup=self.lookup,
+            databases=self.databases,
+            commit_token=self.commit_token,
             timestamp=self.timestamp,
         )
 
@@ -93,6 +187,10 @@ class DoltConfig:
     commit: str = None
     dolthub_remote: bool = False
     push_on_commit: bool = False
+    lock_timeout: Optional[float] = None  # seconds; None waits indefinitely
+    deferred_commit: bool = False  # commit writes on a background thread
+    memory_budget: Optional[int] = None  # bytes a whole-table read may take
+    stream_over_budget: bool = False  # read over-budget tables in chunks
 
     # dolt_fqn: str
 
@@ -104,6 +202,10 @@ class DoltConfig:
             commit=self.commit,
             dolthub_remote=self.dolthub_remote,
             push_on_commit=self.push_on_commit,
+            lock_timeout=self.lock_timeout,
+            deferred_commit=self.deferred_commit,
+            memory_budget=self.memory_budget,
+            stream_over_budget=self.stream_over_budget,
         )
 
 
@@ -128,6 +230,213 @@ class DoltAudit(object):
         return cls(**json.loads(data))
 
 
+AUDIT_VERSION = 2
+DICT, COMPACT, BYTES = "dict", "compact", "bytes"
+ARTIFACT_FORMATS = (DICT, COMPACT, BYTES)
+# string fields that repeat across actions and are stored once per audit
+INTERNED_FIELDS = ("config_id", "pathspec", "table_name", "kind", "query")
+
+
+def encode_audit(audit: dict) -> dict:
+    """
+    Compact form of a `DoltAudit.dict()`: actions become positional rows
+    and repeated strings (config ids, pathspecs, query text) are interned
+    into a shared list. Still plain JSON/pickle-friendly data.
+    """
+    strings = {}
+
+    def intern(value):
+        return value if value is None else strings.setdefault(value, len(strings))
+
+    names = [f.name for f in fields(DoltAction) if f.name != "key"]
+    actions = {}
+    for key, action in audit["actions"].items():
+        actions[key] = [
+            intern(action.get(name)) if name in INTERNED_FIELDS else action.get(name)
+            for name in names
+        ]
+
+    return dict(
+        version=AUDIT_VERSION,
+        fields=names,
+        strings=list(strings),
+        actions=actions,
+        configs=audit["configs"],
+    )
+
+
+def decode_audit(data: dict) -> dict:
+    strings = data["strings"]
+    actions = {}
+    for key, row in data["actions"].items():
+        action = dict(key=key)
+        for name, value in zip(data["fields"], row):
+            if name in INTERNED_FIELDS and value is not None:
+                value = strings[value]
+            action[name] = value
+        actions[key] = action
+    return dict(actions=actions, configs=data["configs"])
+
+
+def dump_audit(audit: dict) -> bytes:
+    """
+    Serialize the compact audit, using msgpack and zstandard when they are
+    installed and falling back to JSON and zlib. The first two bytes record
+    which were used so `load_audit` can reverse it anywhere.
+    """
+    compact = encode_audit(audit)
+    try:
+        import msgpack
+
+        body = b"m" + msgpack.packb(compact, use_bin_type=True)
+    except ImportError:
+        body = b"j" + json.dumps(compact).encode("utf-8")
+
+    try:
+        import zstandard
+
+        return b"z" + zstandard.ZstdCompressor().compress(body)
+    except ImportError:
+        return b"l" + zlib.compress(body)
+
+
+def _loads_audit(data: bytes) -> dict:
+    compression, body = data[:1], data[1:]
+    if compression == b"z":
+        import zstandard
+
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif compression == b"l":
+        body = zlib.decompress(body)
+    else:
+        raise ValueError(f"Unknown Dolt artifact compression: {compression}")
+
+    encoding, body = body[:1], body[1:]
+    if encoding == b"m":
+        import msgpack
+
+        return msgpack.unpackb(body, raw=False)
+    elif encoding == b"j":
+        return json.loads(body.decode("utf-8"))
+    raise ValueError(f"Unknown Dolt artifact encoding: {encoding}")
+
+
+def load_audit(data: Union[dict, bytes]) -> dict:
+    """
+    Accepts a Dolt artifact in any of the `ARTIFACT_FORMATS` and returns the
+    `DoltAudit.dict()` form.
+    """
+    if isinstance(data, bytes):
+        data = _loads_audit(data)
+    if not isinstance(data, dict):
+        raise ValueError(
+            f"Dolt artifact should be type: dict or bytes; found: {type(data)}"
+        )
+    if data.get("version") == AUDIT_VERSION:
+        return decode_audit(data)
+    return data
+
+
+def store_audit(audit: dict, artifact_format: str = DICT) -> Union[dict, bytes]:
+    if artifact_format == COMPACT:
+        return encode_audit(audit)
+    elif artifact_format == BYTES:
+        return dump_audit(audit)
+    return audit
+
+
+def get_changes_query(
+    table: str, from_commit: str, to_commit: str, columns: List[str]
+) -> str:
+    """
+    Net row changes to `table` between two commits, one row per changed key
+    with the `diff_type` (added, modified, removed) and the row's values
+    after the change, or before it for removed rows.
+    """
+    projection = ",\n".join(
+        f"CASE WHEN diff_type = 'removed' THEN `from_{c}` ELSE `to_{c}` END AS `{c}`"
+        for c in columns
+    )
+    return f"""
+        SELECT
+            diff_type,
+            {projection}
+        FROM
+            dolt_diff('{from_commit}', '{to_commit}', '{table}')
+    """
+
+
+def get_aggregate_query(
+    table: str,
+    group_by: List[str],
+    aggs: Dict[str, Tuple[str, str]],
+    where: Optional[str] = None,
+    pushdown: bool = True,
+) -> str:
+    """
+    With `pushdown`, a GROUP BY query computing `aggs` in Dolt. Otherwise
+    the query only projects the grouping and aggregated columns, ordered by
+    group, for `aggregate_pandas_sql`.
+    """
+    groups = [f"`{c}`" for c in group_by]
+    if pushdown:
+        columns = groups + [
+            f"{SQL_AGGREGATES[func]}(`{col}`) AS `{name}`"
+            for name, (col, func) in aggs.items()
+        ]
+    else:
+        inputs = [col for col, _ in aggs.values() if col not in group_by]
+        columns = groups + [f"`{c}`" for c in dict.fromkeys(inputs)]
+
+    query = f"SELECT {', '.join(columns)} FROM `{table}`"
+    if where:
+        query += f" WHERE {where}"
+    if groups:
+        query += f" {'GROUP' if pushdown else 'ORDER'} BY {', '.join(groups)}"
+    return query
+
+
+def substitute_databases(query: str, qualifiers: Dict[str, str]) -> str:
+    """
+    Replace each `{name}` in `query` with the qualifier of the database
+    configured as `name`. Other braces, like `REGEXP '[0-9]{3}'`, are left
+    as they are; an identifier in braces that is not configured raises.
+    """
+
+    def substitute(match):
+        name = match.group(1)
+        if name not in qualifiers:
+            raise ValueError(
+                f"No database configured as {{{name}}}, got: {sorted(qualifiers)}"
+            )
+        return qualifiers[name]
+
+    return re.sub(r"\{([A-Za-z_]\w*)\}", substitute, query)
+
+
+def align_lookup(
+    found: "pd.DataFrame",
+    key_columns: List[str],
+    keys: List[list],
+    columns: Optional[List[str]] = None,
+) -> "pd.DataFrame":
+    """
+    Rows of `found` in the order of `keys`, lists of key column values,
+    with nulls for keys that are absent.
+    """
+    import pandas as pd
+
+    if len(found.columns) == 0:
+        found = pd.DataFrame(columns=key_columns + (columns or []))
+    requested = pd.DataFrame(keys, columns=key_columns)
+    index = (
+        pd.MultiIndex.from_frame(requested)
+        if len(key_columns) > 1
+        else pd.Index(requested[key_columns[0]])
+    )
+    return found.set_index(key_columns).reindex(index).reset_index()
+
+
 def runtime_only(error: bool = True):
     def outer(f):
         @wraps(f)
@@ -159,32 +468,39 @@ def audit_unsafe(f):
 
 
 class DoltDTBase(object):
-    def __init__(self, run: Optional[FlowSpec], config: Optional[DoltConfig] = None):
+    def __init__(
+        self,
+        run: Optional["FlowSpec"],
+        config: Optional[DoltConfig] = None,
+        artifact_format: str = DICT,
+    ):
         """
         Can read or write with Dolt, starting from a single reference commit.
+        `artifact_format` selects how the `dolt` artifact is stored, see
+        `ARTIFACT_FORMATS`; existing artifacts are read in any format.
         """
+        if artifact_format not in ARTIFACT_FORMATS:
+            raise ValueError(f"artifact_format must be one of: {ARTIFACT_FORMATS}")
 
         self._run = run
+        self._artifact_format = artifact_format
         if not self._run:
             self._dolt = DoltAudit().dict()
         elif hasattr(self._run, "data") and hasattr(self._run.data, "dolt"):
-            self._dolt = self._run.data.dolt
+            self._dolt = load_audit(self._run.data.dolt)
         elif hasattr(self._run, "dolt"):
-            self._dolt = self._run.dolt
+            self._dolt = load_audit(self._run.dolt)
         else:
             self._run.dolt = DoltAudit().dict()
             self._dolt = self._run.dolt
 
-        if not isinstance(self._dolt, dict):
-            raise ValueError(
-                f"Dolt artifact should be type: dict; found: {type(self._dolt)}"
-            )
-
         self._config = config
+        self._databases = {}  # query placeholder -> DoltConfig
         self._dbcache = {}  # configid -> Dolt instance
         self._new_actions = {}  # keep track of write state to commit at end
         self._pending_writes = []
         self._dolt_marked = {}
+        self._write_lock = ExitStack()  # held from the first write until commit
 
     def __enter__(self):
         from metaflow import current
@@ -195,12 +511,48 @@ class DoltDTBase(object):
         return self
 
     def __exit__(self, *args, allow_empty: bool = True):
-        if self._new_actions:
-            self._reverse_object_action_marks()
-            self._commit_actions()
-            self._update_dolt_artifact()
+        if self._pending_writes and self._config.deferred_commit:
+            self._defer_commit()
+            return
+
+        with self._write_lock:
+            if self._new_actions:
+                self._reverse_object_action_marks()
+                self._commit_actions()
+                self._update_dolt_artifact()
+        if self._pending_writes:
+            maintain(self._get_db(self._config))
         return
 
+    def _defer_commit(self):
+        """
+        Record the writes in the audit without a commit, then hand the
+        write lock to a background thread that commits them and fills in
+        the commit. The commit is queued durably first, so it is still made
+        by the next writer or `wait_for_commits` if this process dies.
+        """
+        self._reverse_object_action_marks()
+        db = self._get_db(self._config)
+        # contexts of one step share the pathspec, so replays find the commit by this
+        token = str(uuid.uuid4())
+        for a in self._pending_writes:
+            a.commit_token = token
+        tables = [a.table_name for a in self._pending_writes] + [FINGERPRINT_TABLE]
+        entry = enqueue_commit(db.repo_dir, self._commit_message(token), tables)
+        self._update_dolt_artifact()
+
+        write_lock = self._write_lock.pop_all()
+        repo_lock(db.repo_dir).disown()
+
+        def commit():
+            with write_lock:
+                self._commit_actions(token=token)
+                os.remove(entry)
+            self._update_dolt_artifact()
+            maintain(db)
+
+        commit_in_background(db.repo_dir, commit)
+
     @runtime_only()
     def _reverse_object_action_marks(self):
         new_attributes = set(vars(self._run).keys()) - self._start_run_attributes
@@ -211,7 +563,20 @@ class DoltDTBase(object):
             if key and key in self._new_actions:
                 self._new_actions[key].artifact_name = a
 
-    def read(self, table_name: str, as_key: Optional[str] = None):
+    def read(
+        self,
+        table_name: str,
+        as_key: Optional[str] = None,
+        dtypes: Optional[DtypePolicy] = None,
+    ):
+        """
+        Read `table_name` at the configured commit, narrowing column dtypes
+        from the table schema per `dtypes` when given. With a
+        `memory_budget` in the config, tables estimated to exceed it (see
+        `table_stats`) raise `ReadBudgetExceeded` before anything is read,
+        or with `stream_over_budget` come back as an iterator of DataFrames
+        that each fit the budget.
+        """
         action = DoltAction(
             kind="read",
             key=as_key or table_name,
@@ -221,7 +586,10 @@ class DoltDTBase(object):
             pathspec=self._pathspec,
             table_name=table_name,
         )
-        return self._execute_read_action(action, self._config)
+        chunk_rows = self._get_chunk_rows(action, self._config)
+        if chunk_rows:
+            return self._stream_read_action(action, self._config, chunk_rows, dtypes)
+        return self._execute_read_action(action, self._config, dtypes)
 
     @audit_unsafe
     def sql(self, q: str, as_key: str):
@@ -236,11 +604,39 @@ class DoltDTBase(object):
         )
         return self._execute_read_action(action, self._config)
 
+    @audit_unsafe
+    def query(self, q: str, as_key: str, dtypes: Optional[DtypePolicy] = None):
+        """
+        Run `q` in one Dolt session over every database passed to `DoltDT`
+        as `databases`, so joins across them happen in Dolt. `{name}` in `q`
+        stands for the database configured as `name`, pinned to its commit:
+
+            SELECT * FROM {patients}.visits v JOIN {hospitals}.beds b USING (id)
+
+        The session serves every repository in the databases' shared parent
+        directory, but only the configured ones are pinned and locked, so
+        tables must be referenced through their `{name}` only.
+        """
+        if not self._databases:
+            raise ValueError("Pass databases= to DoltDT to query across databases")
+
+        action = DoltAction(
+            kind="read",
+            key=as_key,
+            commit=self._config.commit,
+            config_id=self._config.id,
+            query=q,
+            pathspec=self._pathspec,
+            table_name=None,
+            databases={name: config.id for name, config in self._databases.items()},
+        )
+        return self._execute_databases_action(action, self._databases, dtypes)
+
     @runtime_only()
     @audit_unsafe
     def write(
         self,
-        df: pd.DataFrame,
+        df: "pd.DataFrame",
         table_name: str,
         pks: List[str] = None,
         as_key: str = None,
@@ -249,12 +645,24 @@ class DoltDTBase(object):
             df = df.reset_index()
             pks = list(df.columns)
         db = self._get_db(self._config)
-        write_pandas(dolt=db, table=table_name, df=df, primary_key=pks)
+        self._write_lock.enter_context(
+            repo_lock(db.repo_dir).exclusive(timeout=self._config.lock_timeout)
+        )
+
+        # rewriting what the table already holds needs no import or commit
+        fingerprint = pandas_fingerprint(df)
+        pending = [a.table_name for a in self._pending_writes]
+        if table_name not in pending and get_fingerprint(db, table_name) == fingerprint:
+            commit = self._get_latest_commit_hash(db)
+        else:
+            write_pandas(dolt=db, table=table_name, df=df, primary_key=pks)
+            set_fingerprint(db, table_name, fingerprint)
+            commit = None
 
         action = DoltAction(
             kind="write",
             key=as_key or table_name,
-            commit=None,
+            commit=commit,
             config_id=self._config.id,
             query=f"SELECT * FROM `{table_name}`",
             pathspec=self._pathspec,
@@ -264,10 +672,196 @@ class DoltDTBase(object):
         self._mark_object(df, action)
         return
 
+    @audit_unsafe
+    def read_changes(
+        self, table_name: str, since: Union[str, "Run"], as_key: Optional[str] = None
+    ) -> "pd.DataFrame":
+        """
+        Rows of `table_name` inserted, updated or deleted between `since` and
+        the configured commit, computed by Dolt rather than by diffing full
+        reads. `since` is a commit, or a metaflow Run/Task (object or
+        pathspec) whose audit recorded the table in this database.
+        """
+        db = self._get_db(self._config)
+        from_commit = self._resolve_since(since, table_name)
+        to_commit = self._config.commit
+
+        # the revision database has the schema at to_commit, without a checkout
+        columns = get_column_types(BranchSession(db.repo_dir, to_commit), table_name)
+
+        action = DoltAction(
+            kind="read",
+            key=as_key or table_name,
+            commit=to_commit,
+            from_commit=from_commit,
+            query=get_changes_query(table_name, from_commit, to_commit, list(columns)),
+            config_id=self._config.id,
+            pathspec=self._pathspec,
+            table_name=table_name,
+        )
+        return self._execute_read_action(action, self._config)
+
+    def _resolve_since(self, since: Union[str, "Run"], table_name: str) -> str:
+        if isinstance(since, str) and "/" not in since:
+            return since
+
+        if isinstance(since, str):
+            from metaflow import Run, Task
+
+            since = Run(since) if since.count("/") == 1 else Task(since)
+
+        audit = load_audit(since.data.dolt)
+        database = os.path.abspath(self._config.database)
+        matches = [
+            a
+            for a in audit["actions"].values()
+            if a["table_name"] == table_name
+            and a["commit"]
+            and os.path.abspath(audit["configs"][a["config_id"]]["database"])
+            == database
+        ]
+        if not matches:
+            raise ValueError(
+                f"No action on table {table_name} in {self._config.database} recorded by {since}"
+            )
+        return max(matches, key=lambda a: a["timestamp"])["commit"]
+
+    @audit_unsafe
+    def lookup(
+        self,
+        table_name: str,
+        keys: list,
+        columns: Optional[List[str]] = None,
+        as_key: Optional[str] = None,
+        batch_size: int = LOOKUP_BATCH_SIZE,
+        max_workers: int = 4,
+    ) -> "pd.DataFrame":
+        """
+        Fetch rows of `table_name` by primary key at the configured commit,
+        using `WHERE <pk> IN (...)` queries of `batch_size` keys run in
+        parallel. `keys` holds scalars, or tuples for composite keys. Rows
+        come back aligned with `keys`, with nulls for keys that are absent.
+        The recorded action's query selects every key at once, so it
+        replays as a single read, aligned the same way.
+        """
+        import pandas as pd
+
+        db = self._get_db(self._config)
+        commit = self._config.commit
+        key_columns = [
+            r["name"]
+            for r in read_rows_sql(
+                db,
+                f"""
+                select
+                    column_name as name
+                from
+                    information_schema.columns
+                where
+                    table_schema = database()
+                    and table_name = '{table_name}'
+                    and column_key = 'PRI'
+                order by
+                    ordinal_position
+            """,
+            )
+        ]
+
+        composite = len(key_columns) > 1
+        requested = pd.DataFrame(
+            [tuple(k) for k in keys] if composite else {key_columns[0]: list(keys)},
+            columns=key_columns,
+        )
+        unique = requested.drop_duplicates()
+        literals = None
+        for col in key_columns:
+            col_literals = get_sql_literals(unique[col])
+            literals = (
+                col_literals if literals is None else literals + ", " + col_literals
+            )
+        literals = ("(" + literals + ")" if composite else literals).values
+
+        select = (
+            "*"
+            if columns is None
+            else ", ".join(
+                f"`{c}`"
+                for c in key_columns + [c for c in columns if c not in key_columns]
+            )
+        )
+        target = ", ".join(f"`{c}`" for c in key_columns)
+        target = f"({target})" if composite else target
+
+        def get_query(batch) -> str:
+            return f"""
+                SELECT {select} FROM `{table_name}` AS OF '{commit}'
+                WHERE {target} IN ({", ".join(batch)})
+            """
+
+        batches = [
+            literals[i : i + batch_size] for i in range(0, len(literals), batch_size)
+        ]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            frames = pool.map(lambda b: read_pandas_sql(db, get_query(b)), batches)
+            frames = [f for f in frames if len(f.columns) > 0]
+
+        found = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        lookup = dict(
+            key_columns=key_columns, keys=requested.values.tolist(), columns=columns
+        )
+        result = align_lookup(found, **lookup)
+
+        action = DoltAction(
+            kind="read",
+            key=as_key or table_name,
+            commit=commit,
+            config_id=self._config.id,
+            query=get_query(literals),
+            pathspec=self._pathspec,
+            table_name=table_name,
+            lookup=lookup,
+        )
+        self._record_read(action, result)
+        return result
+
+    @audit_unsafe
+    def aggregate(
+        self,
+        table_name: str,
+        group_by: List[str],
+        aggs: Dict[str, Tuple[str, str]],
+        where: Optional[str] = None,
+        as_key: Optional[str] = None,
+    ) -> "pd.DataFrame":
+        """
+        Grouped aggregation of `table_name` at the configured commit, e.g.
+        `aggs={"median_price": ("price", "median")}`. When every function is
+        in `SQL_AGGREGATES` the query runs in Dolt; otherwise only the needed
+        columns are streamed back and aggregated in chunks. Either way the
+        action replays from the audit to the same summarized result.
+        """
+        pushdown = all(func in SQL_AGGREGATES for _, func in aggs.values())
+        action = DoltAction(
+            kind="read",
+            key=as_key or table_name,
+            commit=self._config.commit,
+            query=get_aggregate_query(table_name, group_by, aggs, where, pushdown),
+            aggregate=None
+            if pushdown
+            else dict(
+                group_by=list(group_by),
+                aggs={name: list(agg) for name, agg in aggs.items()},
+            ),
+            config_id=self._config.id,
+            pathspec=self._pathspec,
+            table_name=table_name,
+        )
+        return self._execute_read_action(action, self._config)
+
     @audit_unsafe
     def diff(
         self, from_commit: str, to_commit: str, table: Union[str, List[str]]
-    ) -> Dict[str, pd.DataFrame]:
+    ) -> Dict[str, "pd.DataFrame"]:
         def get_query(table: str) -> str:
             return f"""
                 SELECT
@@ -284,33 +878,144 @@ class DoltDTBase(object):
         result = {table: read_pandas_sql(db, get_query(table)) for table in tables}
         return result
 
-    def _execute_read_action(self, action: DoltAction, config: DoltConfig):
+    def _get_chunk_rows(self, action: DoltAction, config: DoltConfig) -> Optional[int]:
+        """
+        Rows per chunk when a whole-table read must be streamed to stay in
+        the config's memory budget, None when it fits. Other reads (queries,
+        lookups, aggregates, changes) are not budgeted.
+        """
+        whole_table = action.query == f"SELECT * FROM `{action.table_name}`"
+        if config.memory_budget is None or not whole_table:
+            return None
+
         db = self._get_db(config)
-        starting_commit = self._get_latest_commit_hash(db)
-        try:
-            with detach_head(db, commit=action.commit):
-                table = read_pandas_sql(db, action.query)
-            self._add_action(action)
-            self._mark_object(table, action)
-            return table
-        except Exception as e:
-            raise e
-        finally:
-            db.sql(query=f"set `@@{db.repo_name}_head` = '{starting_commit}'")
+        stats = table_stats(db, action.table_name, action.commit)
+        if stats.bytes <= config.memory_budget:
+            return None
+        if not config.stream_over_budget:
+            check_read_budget(stats, config.memory_budget)
+        return max(1, config.memory_budget // max(1, stats.row_bytes))
+
+    def _stream_read_action(
+        self,
+        action: DoltAction,
+        config: DoltConfig,
+        chunk_rows: int,
+        dtypes: Optional[DtypePolicy] = None,
+    ) -> Iterator["pd.DataFrame"]:
+        db = self._get_db(config)
+        query = f"SELECT * FROM `{action.table_name}` AS OF '{action.commit}'"
+        chunks = read_pandas_chunks(db, query, chunk_rows)
+        if dtypes is not None:
+            stats = table_stats(db, action.table_name, action.commit)
+            column_types = stats.column_types
+            chunks = (apply_dtype_policy(c, dtypes, column_types) for c in chunks)
+        # a one-pass iterator cannot become an artifact, so it is not marked
+        self._add_action(action)
+        return chunks
+
+    def _execute_databases_action(
+        self,
+        action: DoltAction,
+        configs: Dict[str, DoltConfig],
+        dtypes: Optional[DtypePolicy] = None,
+    ):
+        dbs = {name: self._get_db(config) for name, config in configs.items()}
+        data_dirs = {
+            os.path.dirname(os.path.realpath(db.repo_dir)) for db in dbs.values()
+        }
+        if len(data_dirs) != 1:
+            raise ValueError(
+                f"Databases queried together must share a directory, got: {data_dirs}"
+            )
+
+        session = MultiDatabaseSession(data_dirs.pop())
+        query = substitute_databases(
+            action.query,
+            {
+                name: session.revision(db.repo_dir, configs[name].commit)
+                for name, db in dbs.items()
+            },
+        )
+        with ExitStack() as stack:
+            # revision databases leave working sets alone, commits only must stay
+            for name in sorted(dbs, key=lambda n: os.path.realpath(dbs[n].repo_dir)):
+                lock = repo_lock(dbs[name].repo_dir)
+                stack.enter_context(lock.shared(timeout=configs[name].lock_timeout))
+            table = read_pandas_sql(session, query, dtypes)
+        self._record_read(action, table)
+        return table
+
+    def _execute_read_action(
+        self,
+        action: DoltAction,
+        config: DoltConfig,
+        dtypes: Optional[DtypePolicy] = None,
+    ):
+        table = self._execute_read_actions([action], config, dtypes)[action.key]
+        self._record_read(action, table)
+        return table
+
+    def _execute_read_actions(
+        self,
+        actions: List[DoltAction],
+        config: DoltConfig,
+        dtypes: Optional[DtypePolicy] = None,
+    ) -> Dict[str, "pd.DataFrame"]:
+        """
+        Run reads that share a config and commit under a single checkout.
+        """
+        db = self._get_db(config)
+        lock = repo_lock(db.repo_dir)
+        commit = actions[0].commit
+
+        # reads at the checked out commit only need to keep others from moving it
+        with lock.shared(timeout=config.lock_timeout):
+            if self._get_latest_commit_hash(db) == commit:
+                return {a.key: self._read_query(db, a, dtypes) for a in actions}
+
+        with lock.exclusive(timeout=config.lock_timeout):
+            starting_commit = self._get_latest_commit_hash(db)
+            try:
+                with detach_head(db, commit=commit):
+                    return {a.key: self._read_query(db, a, dtypes) for a in actions}
+            except Exception as e:
+                raise e
+            finally:
+                db.sql(query=f"set `@@{db.repo_name}_head` = '{starting_commit}'")
+
+    @staticmethod
+    def _read_query(
+        db: Dolt, action: DoltAction, dtypes: Optional[DtypePolicy] = None
+    ) -> "pd.DataFrame":
+        if action.aggregate:
+            return aggregate_pandas_sql(db, action.query, **action.aggregate)
+        if action.lookup:
+            return align_lookup(read_pandas_sql(db, action.query), **action.lookup)
+        column_types = None
+        if dtypes is not None and action.table_name:
+            column_types = get_column_types(db, action.table_name)
+        return read_pandas_sql(db, action.query, dtypes, column_types)
+
+    def _record_read(self, action: DoltAction, table: "pd.DataFrame"):
+        self._add_action(action)
+        self._mark_object(table, action)
 
     @runtime_only(error=False)
     def _add_action(self, action: DoltAction):
         if action.key in self._new_actions:
             raise ValueError("Duplicate key attempted to override dolt state")
 
-        if action.kind == "write":
+        if action.kind == "write" and action.commit is None:
             self._pending_writes.append(action)
 
         self._new_actions[action.key] = action
         return
 
     def _hash_object(self, obj):
-        if isinstance(obj, pd.DataFrame):
+        # an object can only be a DataFrame if pandas was already imported
+        pd = sys.modules.get("pandas")
+        if pd is not None and isinstance(obj, pd.DataFrame):
             h = hashlib.sha256(
                 pd.util.hash_pandas_object(obj, index=True).values
             ).hexdigest()
@@ -324,28 +1029,51 @@ class DoltDTBase(object):
 
     @runtime_only()
     @audit_unsafe
-    def _commit_actions(self, allow_empty: bool = True):
+    def _commit_actions(self, allow_empty: bool = True, token: Optional[str] = None):
         if not self._pending_writes:
             return
 
         db = self._get_db(self._config)
         for a in self._pending_writes:
             db.add(a.table_name)
+        db.add(FINGERPRINT_TABLE)
 
-        db.commit(f"Run: {self._pathspec}", allow_empty=allow_empty)
+        db.commit(self._commit_message(token), allow_empty=allow_empty)
         commit = self._get_latest_commit_hash(db)
         for a in self._pending_writes:
             self._new_actions[a.key].commit = commit
 
         return
 
+    def _commit_message(self, token: Optional[str] = None) -> str:
+        message = f"Run: {self._pathspec}"
+        return message if token is None else f"{message}\n\nCommit-Token: {token}"
+
     def _update_dolt_artifact(self):
-        self._dolt["actions"].update(
-            {k: v.dict() for k, v in self._new_actions.items()}
+        configs = [self._config, *self._databases.values()]
+        self._store_dolt_artifact(
+            {k: v.dict() for k, v in self._new_actions.items()},
+            {config.id: config.dict() for config in configs},
         )
-        self._dolt["configs"][self._config.id] = self._config.dict()
         return
 
+    def _store_dolt_artifact(self, actions: dict, configs: dict):
+        """
+        Add this DoltDT's `actions` and `configs` to the audit and store it.
+        The step's current artifact is reloaded first, so that stores of
+        other DoltDTs in the step, possibly finishing on commit threads, are
+        merged rather than overwritten.
+        """
+        with _artifact_lock:
+            # only a running step's FlowSpec owns its artifact, client Runs are not
+            owned = self._run is not None and not hasattr(self._run, "data")
+            if owned and getattr(self._run, "dolt", None) is not None:
+                self._dolt = load_audit(self._run.dolt)
+            self._dolt["actions"].update(actions)
+            self._dolt["configs"].update(configs)
+            if owned:
+                self._run.dolt = store_audit(self._dolt, self._artifact_format)
+
     def _get_db(self, config: DoltConfig):
         if config.id in self._dbcache:
             return self._dbcache[config.id]
@@ -362,25 +1090,27 @@ class DoltDTBase(object):
             )
 
         doltdb = Dolt(repo_dir=config.database)
-        current_branch, branches = doltdb.branch()
-
-        logger.info(
-            f"Dolt database in {config.database} at branch {current_branch.name}, using branch {config.branch}"
-        )
-        if config.branch == current_branch.name:
-            pass
-        elif config.branch not in [branch.name for branch in branches]:
-            raise ValueError(f"Passed branch '{config.branch}' that does not exist")
-        else:
-            doltdb.checkout(config.branch, checkout_branch=False)
+        with repo_lock(config.database).exclusive(timeout=config.lock_timeout):
+            current_branch, branches = doltdb.branch()
 
-        if not doltdb.status().is_clean:
-            raise Exception(
-                "DoltDT as context manager requires clean working set for transaction semantics"
+            logger.info(
+                f"Dolt database in {config.database} at branch {current_branch.name}, using branch {config.branch}"
             )
+            if config.branch == current_branch.name:
+                pass
+            elif config.branch not in [branch.name for branch in branches]:
+                raise ValueError(f"Passed branch '{config.branch}' that does not exist")
+            else:
+                doltdb.checkout(config.branch, checkout_branch=False)
 
-        if not config.commit:
-            config.commit = self._get_latest_commit_hash(doltdb)
+            drain_commits(doltdb)
+            if not doltdb.status().is_clean:
+                raise Exception(
+                    "DoltDT as context manager requires clean working set for transaction semantics"
+                )
+
+            if not config.commit:
+                config.commit = self._get_latest_commit_hash(doltdb)
 
         self._dbcache[config.id] = doltdb
         return doltdb
@@ -395,7 +1125,7 @@ class DoltDTBase(object):
 
         return f"{current.flow_name}/{current.run_id}/{current.step_name}/{current.task_id}"
 
-    def get_run(self, table: str, branch: str = "master", commit: str = None) -> Run:
+    def get_run(self, table: str, branch: str = "master", commit: str = None) -> "Run":
         db = self._get_db(self._config)
 
         if commit:
@@ -437,41 +1167,153 @@ class DoltDTBase(object):
         """,
         )
         commit_to_run_map = {
-            row["commit_hash"]: row["message"].lstrip("Run: ") for row in commit_data
+            row["commit_hash"]: row["message"].splitlines()[0][len("Run: ") :]
+            for row in commit_data
         }
 
         return commit_to_run_map[_commit]
 
 
 class DoltBranchDT(DoltDTBase):
-    def __init__(self, run: FlowSpec, config: DoltConfig):
-        super().__init__(run=run, config=config)
+    def __init__(
+        self,
+        run: "FlowSpec",
+        config: Optional[DoltConfig] = None,
+        artifact_format: str = DICT,
+        databases: Optional[Dict[str, DoltConfig]] = None,
+    ):
+        """
+        `databases` names configs that `query` can join across; `config`
+        (default: the first of them) is used by the other methods.
+        """
+        if config is None and databases:
+            config = next(iter(databases.values()))
+        super().__init__(run=run, config=config, artifact_format=artifact_format)
+        self._databases = dict(databases or {})
         self._get_db(self._config)
+        for database in self._databases.values():
+            self._get_db(database)
 
 
 class DoltAuditDT(DoltDTBase):
-    def __init__(self, audit: dict, run: Optional[FlowSpec] = None):
+    def __init__(
+        self,
+        audit: Union[dict, bytes],
+        run: Optional["FlowSpec"] = None,
+        artifact_format: str = DICT,
+    ):
         """
         Can only read from a AuditDT, and reading is isolated to the audit.
         """
-        super().__init__(run=run)
+        super().__init__(run=run, artifact_format=artifact_format)
+        audit = load_audit(audit)
         self._read_audit = audit
         self._sactions = {k: DoltAction(**v) for k, v in audit["actions"].items()}
         self._sconfigs = {k: DoltConfig(**v) for k, v in audit["configs"].items()}
+        self._prefetched = {}  # action key -> DataFrame replayed ahead of read
+
+    def read(
+        self,
+        key,
+        as_key: Optional[str] = None,
+        dtypes: Optional[DtypePolicy] = None,
+    ):
+        action = self._replay_action(key, as_key)
+        if key in self._prefetched:
+            table = self._prefetched.pop(key)
+            if dtypes is not None:
+                apply_dtype_policy(table, dtypes)
+            self._record_read(action, table)
+            return table
+
+        if action.databases:
+            configs = {n: self._sconfigs[c] for n, c in action.databases.items()}
+            return self._execute_databases_action(action, configs, dtypes)
+
+        config = self._sconfigs[action.config_id]
+        chunk_rows = self._get_chunk_rows(action, config)
+        if chunk_rows:
+            return self._stream_read_action(action, config, chunk_rows, dtypes)
+        return self._execute_read_action(action, config, dtypes)
+
+    def prefetch(self, keys: Optional[List[str]] = None, max_workers: int = None):
+        """
+        Replay the audited reads for `keys` (default: every action in the
+        audit) ahead of `read`. Actions are grouped by config and commit so
+        each commit is checked out once, and databases are read in parallel.
+        """
+        plan = defaultdict(lambda: defaultdict(list))
+        for key in keys or self._sactions:
+            action = self._replay_action(key)
+            if action.databases:
+                continue  # one session over several databases, run by read
+            config = self._sconfigs[action.config_id]
+            # checkouts are per working directory, so one worker per database
+            plan[config.database][(action.config_id, action.commit)].append(action)
+
+        def replay_database(groups):
+            tables = {}
+            for (config_id, _), actions in groups.items():
+                tables.update(
+                    self._execute_read_actions(actions, self._sconfigs[config_id])
+                )
+            return tables
+
+        if not plan:
+            return
+        with ThreadPoolExecutor(max_workers=max_workers or len(plan)) as pool:
+            for tables in pool.map(replay_database, plan.values()):
+                self._prefetched.update(tables)
+
+    def replay_all(
+        self, keys: Optional[List[str]] = None, max_workers: int = None
+    ) -> Dict[str, "pd.DataFrame"]:
+        """
+        Read every action in `keys` (default: the whole audit), returning
+        DataFrames by action key. See `prefetch`.
+        """
+        keys = keys or list(self._sactions)
+        self.prefetch(keys, max_workers=max_workers)
+        return {key: self.read(key) for key in keys}
 
-    def read(self, key, as_key: Optional[str] = None):
+    def _replay_action(self, key: str, as_key: Optional[str] = None) -> DoltAction:
         audit_action = self._sactions.get(key, None)
         if not audit_action:
             raise ValueError("Key not found in audit")
 
         action = audit_action.copy()
         action.key = as_key or key
+        if action.commit is None and action.kind == "write":
+            action.commit = self._resolve_deferred_commit(action)
         if action.kind != "read":
             action.kind = "read"
             action.query = action.query or f"SELECT * FROM `{action.table_name}`"
+        return action
+
+    def _resolve_deferred_commit(self, action: DoltAction) -> str:
+        """
+        Commit of a write whose step deferred committing, found by the
+        token in its message once pending commits have completed.
+        """
+        if action.commit_token is None:
+            raise ValueError(f"No commit recorded for write {action.key}")
 
         config = self._sconfigs[action.config_id]
-        return self._execute_read_action(action, config)
+        wait_for_commits(config.database, timeout=config.lock_timeout)
+        commits = read_rows_sql(
+            Dolt(config.database),
+            f"""
+            select
+                commit_hash
+            from
+                dolt_log
+            where
+                message like '%Commit-Token: {action.commit_token}'
+        """,
+        )
+        if not commits:
+            raise ValueError(f"No commit found for deferred write {action.key}")
+        return commits[0]["commit_hash"]
 
     def __exit__(self, *args, allow_empty: bool = True):
         if self._new_actions:
@@ -480,25 +1322,111 @@ class DoltAuditDT(DoltDTBase):
         return
 
     def _update_dolt_artifact(self):
+        actions, configs = {}, {}
         for k, v in self._new_actions.items():
-            self._dolt["actions"][k] = v.dict()
-            self._dolt["configs"][v.config_id] = self._sconfigs[v.config_id].dict()
+            actions[k] = v.dict()
+            for config_id in [v.config_id, *(v.databases or {}).values()]:
+                configs[config_id] = self._sconfigs[config_id].dict()
+        self._store_dolt_artifact(actions, configs)
         return
 
 
 def DoltDT(
-    run: Optional[Union[str, FlowSpec]] = None,
-    audit: Optional[dict] = None,
+    run: Optional[Union[str, "FlowSpec"]] = None,
+    audit: Optional[Union[dict, bytes]] = None,
     config: Optional[DoltConfig] = None,
+    artifact_format: str = DICT,
+    databases: Optional[Dict[str, DoltConfig]] = None,
 ):
+    from metaflow import Run
+
     _run = Run(run) if type(run) == str else run
-    if config and audit:
+    if (config or databases) and audit:
         logger.warning("Specified audit or config mode, will use aduit.")
     elif audit:
-        return DoltAuditDT(audit=audit, run=_run)
-    elif config:
-        return DoltBranchDT(_run, config)
+        return DoltAuditDT(audit=audit, run=_run, artifact_format=artifact_format)
+    elif config or databases:
+        return DoltBranchDT(
+            _run, config, artifact_format=artifact_format, databases=databases
+        )
     elif _run and hasattr(_run, "data") and hasattr(_run.data, "dolt"):
-        return DoltAuditDT(audit=_run.data.dolt, run=_run)
+        return DoltAuditDT(
+            audit=_run.data.dolt, run=_run, artifact_format=artifact_format
+        )
     else:
         raise ValueError("Specify one of: audit, config")
+
+
+class DoltInputs(object):
+    def __init__(
+        self, dt: DoltDTBase, reads: Dict[str, str], max_workers: Optional[int] = None
+    ):
+        """
+        Reads declared by a step, started on background threads when the
+        step begins and resolved on first access, as attributes or items.
+        A read is a table name or, if it contains whitespace, a query; an
+        audit replays the action recorded under the same key. The threads
+        are not lent the step's write lock, so resolve reads before writing
+        to the same database.
+        """
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or len(reads) or 1)
+        self._futures = {
+            key: self._pool.submit(self._read, dt, key, source)
+            for key, source in reads.items()
+        }
+
+    @staticmethod
+    def _read(dt: DoltDTBase, key: str, source: str) -> "pd.DataFrame":
+        if isinstance(dt, DoltAuditDT):
+            return dt.read(key)
+        elif len(source.split()) > 1:
+            return dt.sql(source, as_key=key)
+        return dt.read(source, as_key=key)
+
+    def __getitem__(self, key: str) -> "pd.DataFrame":
+        return self._futures[key].result()
+
+    def __getattr__(self, key: str) -> "pd.DataFrame":
+        futures = self.__dict__.get("_futures", {})
+        if key not in futures:
+            raise AttributeError(f"No Dolt read declared as {key}")
+        return futures[key].result()
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+def dolt_step(
+    reads: Dict[str, str],
+    config: Optional[Union[DoltConfig, Callable[["FlowSpec"], DoltConfig]]] = None,
+    audit: Optional[Union[dict, bytes, Callable[["FlowSpec"], dict]]] = None,
+    attribute: str = "dolt_inputs",
+    max_workers: Optional[int] = None,
+):
+    """
+    Step decorator, applied below `@step`, that opens a DoltDT for the step
+    and starts its `reads` (key -> table or query) in the background, so
+    Dolt I/O overlaps the step's own work. Results are available as
+    `self.<attribute>.<key>` and are recorded in the audit as `read` and
+    `sql` would. `config` and `audit` may be callables taking the flow, to
+    use its parameters.
+    """
+
+    def outer(f):
+        @wraps(f)
+        def inner(flow, *args, **kwargs):
+            _config = config(flow) if callable(config) else config
+            _audit = audit(flow) if callable(audit) else audit
+            with DoltDT(run=flow, config=_config, audit=_audit) as dt:
+                inputs = DoltInputs(dt, reads, max_workers=max_workers)
+                setattr(flow, attribute, inputs)
+                try:
+                    return f(flow, *args, **kwargs)
+                finally:
+                    # unresolved reads still finish and are recorded
+                    inputs.close()
+                    delattr(flow, attribute)
+
+        return inner
+
+    return outer
@@ -1 +1,15 @@
-from .utils import write_pandas, read_pandas, read_pandas_sql
+from .commits import wait_for_commits
+from .dataset import DoltDataset
+from .maintenance import MaintenancePolicy, enable_maintenance, run_gc
+from .pool import ClonePool
+from .session import BranchSession, MultiDatabaseSession
+from .stats import ReadBudgetExceeded, table_stats
+from .utils import (
+    DtypePolicy,
+    asof_join,
+    insert_pandas,
+    write_pandas,
+    read_numpy,
+    read_pandas,
+    read_pandas_sql,
+)
@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+import uuid
+
+from doltcli import Dolt
+
+from .lock import repo_lock
+
+logger = logging.getLogger()
+
+QUEUE_DIR = "integrations.commits"
+
+_workers: Dict[str, List[threading.Thread]] = {}
+_workers_guard = threading.Lock()
+
+
+def _queue_path(repo_dir: str) -> str:
+    return os.path.join(repo_dir, ".dolt", QUEUE_DIR)
+
+
+def enqueue_commit(repo_dir: str, message: str, tables: List[str]) -> str:
+    """
+    Durably record a commit that is still to be made, returning the entry's
+    path. Must be called holding the repository's exclusive lock, which is
+    kept until the entry is committed and removed, so entries found by
+    anyone else holding the lock were left by a process that died.
+    """
+    path = _queue_path(repo_dir)
+    os.makedirs(path, exist_ok=True)
+    entry = os.path.join(path, f"{uuid.uuid4()}.json")
+    with open(entry + ".tmp", "w") as f:
+        json.dump(dict(message=message, tables=tables), f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(entry + ".tmp", entry)
+    return entry
+
+
+def pending_commits(repo_dir: str) -> List[str]:
+    path = _queue_path(repo_dir)
+    if not os.path.isdir(path):
+        return []
+    return sorted(
+        os.path.join(path, name) for name in os.listdir(path) if name.endswith(".json")
+    )
+
+
+def drain_commits(db: Dolt, timeout: Optional[float] = None) -> int:
+    """
+    Make the commits of queue entries whose writer died before committing.
+    Returns how many entries were drained.
+    """
+    with repo_lock(db.repo_dir).exclusive(timeout=timeout):
+        entries = pending_commits(db.repo_dir)
+        for entry in entries:
+            with open(entry, "r") as f:
+                pending = json.load(f)
+            db.add(pending["tables"])
+            if not db.status().is_clean:
+                logger.warning(f"Committing orphaned write: {pending['message']}")
+                db.commit(pending["message"])
+            os.remove(entry)
+    return len(entries)
+
+
+def commit_in_background(repo_dir: str, commit: Callable[[], None]) -> threading.Thread:
+    """
+    Run `commit` on a worker thread registered for `wait_for_commits`. The
+    thread is not a daemon, so the interpreter finishes it before exiting.
+    """
+    key = os.path.realpath(repo_dir)
+    worker = threading.Thread(target=commit, name=f"dolt-commit-{key}")
+    with _workers_guard:
+        _workers.setdefault(key, []).append(worker)
+    worker.start()
+    return worker
+
+
+def wait_for_commits(repo_dir: str, timeout: Optional[float] = None) -> int:
+    """
+    Barrier before reading what deferred writes committed: joins this
+    process's commit workers for `repo_dir`, then drains entries left by
+    dead processes. Returns how many entries were drained.
+    """
+    key = os.path.realpath(repo_dir)
+    with _workers_guard:
+        workers = _workers.pop(key, [])
+    for worker in workers:
+        worker.join(timeout)
+    alive = [w for w in workers if w.is_alive()]
+    if alive:
+        with _workers_guard:
+            _workers.setdefault(key, []).extend(alive)
+        raise TimeoutError(f"Timed out waiting for commits to {repo_dir}")
+    return drain_commits(Dolt(repo_dir), timeout=timeout)
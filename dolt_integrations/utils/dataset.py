@@ -0,0 +1,202 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional
+
+from doltcli import Dolt
+
+from .lock import repo_lock
+from .utils import get_sql_literals, read_pandas_sql, read_table_sql
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class DoltDataset(object):
+    def __init__(
+        self,
+        dolt: Dolt,
+        table: str,
+        columns: Optional[List[str]] = None,
+        key: Optional[str] = None,
+        commit: Optional[str] = None,
+        where: Optional[str] = None,
+        batch_size: int = 256,
+        block_rows: int = 65536,
+        shuffle: bool = False,
+        seed: Optional[int] = None,
+        shard_index: int = 0,
+        num_shards: int = 1,
+        prefetch: int = 2,
+        workers: int = 1,
+        drop_last: bool = False,
+        dtypes: Optional[Dict[str, str]] = None,
+    ):
+        """
+        Iterable over batches of `table` as of one commit, for training on
+        tables that do not fit in memory. Each batch is a dict of column ->
+        contiguous NumPy array, so it can back a PyTorch `IterableDataset`
+        or a `tf.data.Dataset.from_generator` without either being needed.
+
+        Rows are read in blocks of about `block_rows` consecutive `key`
+        values (default: the table's single-column primary key). Blocks
+        are split round-robin between `num_shards` shards, and `prefetch`
+        blocks are read ahead on `workers` background threads. With
+        `shuffle`, the block order and the rows within each block are
+        permuted per epoch, see `set_epoch`.
+        """
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(f"shard_index must be in [0, {num_shards})")
+
+        self.dolt = dolt
+        self.table = table
+        self.columns = columns
+        self.commit = commit or dolt.head
+        self.where = where
+        self.batch_size = batch_size
+        self.block_rows = block_rows
+        self.shuffle = shuffle
+        self.seed = seed
+        self.shard_index = shard_index
+        self.num_shards = num_shards
+        self.prefetch = max(1, prefetch)
+        self.workers = workers
+        self.drop_last = drop_last
+        self.dtypes = dtypes or {}
+        self.epoch = 0
+
+        self.key = key or self._get_key()
+        self._bounds: Optional[List[str]] = None
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def _get_key(self) -> str:
+        keys = read_table_sql(
+            self.dolt,
+            f"""
+            select
+                column_name as name
+            from
+                information_schema.columns
+            where
+                table_schema = database()
+                and table_name = '{self.table}'
+                and column_key = 'PRI'
+        """,
+        )
+        if len(keys) != 1:
+            raise ValueError(
+                f"Table {self.table} needs a single-column primary key, or pass key="
+            )
+        return keys[0]["name"]
+
+    def _filter(self, *conditions: str) -> str:
+        conditions = [c for c in (self.where,) + conditions if c]
+        return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    @property
+    def bounds(self) -> List[str]:
+        """
+        SQL literals of the first key in each block.
+        """
+        if self._bounds is None:
+            import pandas as pd
+
+            query = f"""
+                SELECT `{self.key}` FROM `{self.table}` AS OF '{self.commit}'
+                {self._filter()} ORDER BY `{self.key}`
+            """
+
+            def parser(sql_output: str) -> List[str]:
+                try:
+                    chunks = pd.read_csv(sql_output, chunksize=self.block_rows)
+                    firsts = [chunk[self.key].iloc[:1] for chunk in chunks]
+                except pd.errors.EmptyDataError:
+                    return []
+                return list(get_sql_literals(pd.concat(firsts))) if firsts else []
+
+            with repo_lock(self.dolt.repo_dir).shared():
+                self._bounds = read_table_sql(self.dolt, query, result_parser=parser)
+        return self._bounds
+
+    def _read_block(self, block: int) -> Dict[str, "np.ndarray"]:
+        import numpy as np
+
+        bounds = self.bounds
+        conditions = [f"`{self.key}` >= {bounds[block]}"]
+        if block + 1 < len(bounds):
+            conditions.append(f"`{self.key}` < {bounds[block + 1]}")
+        projection = (
+            "*" if self.columns is None else ", ".join(f"`{c}`" for c in self.columns)
+        )
+        query = f"""
+            SELECT {projection} FROM `{self.table}` AS OF '{self.commit}'
+            {self._filter(*conditions)}
+        """
+        with repo_lock(self.dolt.repo_dir).shared():
+            df = read_pandas_sql(self.dolt, query)
+        return {
+            col: np.ascontiguousarray(df[col].to_numpy(self.dtypes.get(col)))
+            for col in df.columns
+        }
+
+    def __iter__(self) -> Iterator[Dict[str, "np.ndarray"]]:
+        import numpy as np
+
+        seed = None if self.seed is None else self.seed + self.epoch
+        rng = np.random.default_rng(seed)
+        blocks = list(range(len(self.bounds)))[self.shard_index :: self.num_shards]
+        if self.shuffle:
+            rng.shuffle(blocks)
+
+        buffered: List[Dict[str, "np.ndarray"]] = []
+        size = 0
+        # under a caller's exclusive hold, the workers read through its loan
+        read_block = repo_lock(self.dolt.repo_dir).lent(self._read_block)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            remaining = iter(blocks)
+            reads = deque(
+                pool.submit(read_block, b) for b in islice(remaining, self.prefetch)
+            )
+            while reads:
+                block = reads.popleft().result()
+                following = next(remaining, None)
+                if following is not None:
+                    reads.append(pool.submit(read_block, following))
+
+                n = len(next(iter(block.values()), ()))
+                if n == 0:
+                    continue
+                if self.shuffle:
+                    order = rng.permutation(n)
+                    block = {col: values[order] for col, values in block.items()}
+                buffered.append(block)
+                size += n
+
+                while size >= self.batch_size:
+                    batch, buffered = self._take(buffered, self.batch_size)
+                    size -= self.batch_size
+                    yield batch
+
+        if size and not self.drop_last:
+            yield self._take(buffered, size)[0]
+
+    @staticmethod
+    def _take(buffered: List[Dict[str, "np.ndarray"]], n: int):
+        import numpy as np
+
+        parts, rest, taken = [], list(buffered), 0
+        while taken < n:
+            block = rest.pop(0)
+            size = len(next(iter(block.values())))
+            if taken + size <= n:
+                parts.append(block)
+                taken += size
+            else:
+                cut = n - taken
+                parts.append({col: values[:cut] for col, values in block.items()})
+                rest.insert(0, {col: values[cut:] for col, values in block.items()})
+                taken = n
+        batch = {col: np.concatenate([p[col] for p in parts]) for col in parts[0]}
+        return batch, rest
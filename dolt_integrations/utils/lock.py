@@ -0,0 +1,252 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import wraps
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import quote
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover, not available on Windows
+    fcntl = None
+
+logger = logging.getLogger()
+
+SHARED, EXCLUSIVE = "shared", "exclusive"
+
+
+class LockTimeout(TimeoutError):
+    pass
+
+
+@dataclass
+class LockMetrics:
+    """
+    Lock-wait statistics for one repository, accumulated in this process.
+    """
+
+    shared_acquired: int = 0
+    exclusive_acquired: int = 0
+    timeouts: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    def dict(self):
+        return dict(
+            shared_acquired=self.shared_acquired,
+            exclusive_acquired=self.exclusive_acquired,
+            timeouts=self.timeouts,
+            total_wait=self.total_wait,
+            max_wait=self.max_wait,
+        )
+
+
+class RepoLock(object):
+    def __init__(
+        self, repo_dir: str, poll_interval: float = 0.01, scope: Optional[str] = None
+    ):
+        """
+        Reader/writer lock over a Dolt repository directory, shared between
+        processes on the host with `flock`. Operations that only read the
+        checked out commit take it shared; anything that checks out, imports
+        or commits takes it exclusive.
+
+        Acquirers pass through a separate queue lock one at a time, so a
+        waiting writer holds back readers that arrive after it instead of
+        being starved by them. Locks are reentrant per thread, but a shared
+        lock cannot be upgraded to exclusive. Other threads wait for an
+        exclusive hold like other processes do, unless the holder lends it to
+        threads it starts (see `lent`); the hold is then only released once
+        they are done.
+
+        With `scope`, the lock guards only that part of the repository (see
+        `branch_lock`) and is independent of the lock over the whole of it.
+        """
+        self.repo_dir = repo_dir
+        self.scope = scope
+        self.poll_interval = poll_interval
+        self.metrics = LockMetrics()
+        self._local = threading.local()
+        self._metrics_lock = threading.Lock()
+        self._lending = threading.Condition()
+        self._loan: Optional[object] = None  # token of the current exclusive hold
+        self._borrowers = 0
+
+    def shared(self, timeout: Optional[float] = None):
+        return self._acquire(SHARED, timeout)
+
+    def exclusive(self, timeout: Optional[float] = None):
+        return self._acquire(EXCLUSIVE, timeout)
+
+    @property
+    def held(self) -> Optional[str]:
+        return getattr(self._local, "mode", None)
+
+    def disown(self):
+        """
+        Stop treating the lock held by this thread as its own, so that the
+        context holding it can be closed from another thread. This thread
+        will block on the lock again until that happens.
+        """
+        self._local.mode = None
+        with self._lending:
+            self._loan = None
+
+    def lend(self) -> object:
+        """
+        Token of this thread's exclusive hold, for `borrow` in worker threads
+        the holder starts.
+        """
+        if self.held != EXCLUSIVE:
+            raise RuntimeError(f"Only an exclusive holder can lend {self.repo_dir}")
+        with self._lending:
+            return self._loan
+
+    @contextmanager
+    def borrow(self, loan: object):
+        """
+        Hold the lock shared in this thread under the exclusive hold that
+        lent `loan`, which is released only after the borrowers return.
+        """
+        with self._lending:
+            if loan is None or loan is not self._loan:
+                raise RuntimeError(f"The hold that lent {self.repo_dir} has ended")
+            self._borrowers += 1
+        self._local.mode = SHARED
+        try:
+            yield
+        finally:
+            self._local.mode = None
+            with self._lending:
+                self._borrowers -= 1
+                self._lending.notify_all()
+
+    def lent(self, fn: Callable) -> Callable:
+        """
+        `fn` for a worker thread: when this thread holds the lock exclusive,
+        the worker borrows it shared instead of waiting for the hold to end.
+        """
+        if self.held != EXCLUSIVE:
+            return fn
+
+        loan = self.lend()
+
+        @wraps(fn)
+        def borrowing(*args, **kwargs):
+            with self.borrow(loan):
+                return fn(*args, **kwargs)
+
+        return borrowing
+
+    @contextmanager
+    def _acquire(self, mode: str, timeout: Optional[float]):
+        if self.held == EXCLUSIVE or (self.held == SHARED and mode == SHARED):
+            yield
+            return
+        elif self.held == SHARED:
+            raise RuntimeError(
+                f"Cannot upgrade shared lock on {self.repo_dir} to exclusive"
+            )
+        elif fcntl is None:
+            yield
+            return
+
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        fd = os.open(self._path("lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                queue = os.open(self._path("queue"), os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    self._flock(queue, fcntl.LOCK_EX, deadline)
+                    op = fcntl.LOCK_SH if mode == SHARED else fcntl.LOCK_EX
+                    self._flock(fd, op, deadline)
+                finally:
+                    os.close(queue)
+            except LockTimeout:
+                with self._metrics_lock:
+                    self.metrics.timeouts += 1
+                raise
+
+            self._record(mode, time.monotonic() - start)
+            self._local.mode = mode
+            if mode == EXCLUSIVE:
+                with self._lending:
+                    self._loan = object()
+            try:
+                yield
+            finally:
+                self._local.mode = None
+                if mode == EXCLUSIVE:
+                    with self._lending:
+                        self._loan = None
+                        self._lending.wait_for(lambda: self._borrowers == 0)
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def _flock(self, fd: int, op: int, deadline: Optional[float]):
+        if deadline is None:
+            fcntl.flock(fd, op)
+            return
+
+        while True:
+            try:
+                fcntl.flock(fd, op | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(f"Timed out waiting for lock on {self.repo_dir}")
+                time.sleep(self.poll_interval)
+
+    def _record(self, mode: str, wait: float):
+        with self._metrics_lock:
+            if mode == SHARED:
+                self.metrics.shared_acquired += 1
+            else:
+                self.metrics.exclusive_acquired += 1
+            self.metrics.total_wait += wait
+            self.metrics.max_wait = max(self.metrics.max_wait, wait)
+        logger.debug(f"Acquired {mode} lock on {self.repo_dir} after {wait:.3f}s")
+
+    def _path(self, name: str) -> str:
+        dolt_dir = os.path.join(self.repo_dir, ".dolt")
+        base = dolt_dir if os.path.isdir(dolt_dir) else self.repo_dir
+        if self.scope is not None:
+            name = f"{quote(self.scope, safe='')}.{name}"
+        return os.path.join(base, f"integrations.{name}")
+
+
+_locks: Dict[Tuple[str, Optional[str]], RepoLock] = {}
+_locks_guard = threading.Lock()
+
+
+def repo_lock(repo_dir: str) -> RepoLock:
+    """
+    The process-wide lock for a repository directory.
+    """
+    return _scoped_lock(repo_dir, None)
+
+
+def branch_lock(repo_dir: str, branch: str) -> RepoLock:
+    """
+    The process-wide lock for one branch of a repository. Sessions writing
+    to a branch through its revision database take it exclusive, so they
+    exclude each other without holding the whole repository.
+    """
+    return _scoped_lock(repo_dir, f"branch.{branch}")
+
+
+def _scoped_lock(repo_dir: str, scope: Optional[str]) -> RepoLock:
+    key = (os.path.realpath(repo_dir), scope)
+    with _locks_guard:
+        if key not in _locks:
+            _locks[key] = RepoLock(key[0], scope=scope)
+        return _locks[key]
+
+
+def lock_metrics(repo_dir: str) -> LockMetrics:
+    return repo_lock(repo_dir).metrics
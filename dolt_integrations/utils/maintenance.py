@@ -0,0 +1,196 @@
+from dataclasses import asdict, dataclass
+import datetime
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+from doltcli import Dolt, read_rows_sql
+
+from .lock import repo_lock
+
+logger = logging.getLogger()
+
+STATE_FILE = "integrations.maintenance.json"
+
+
+@dataclass
+class MaintenancePolicy:
+    """
+    When `maintain` runs `dolt gc`: after `gc_every_commits` automated
+    commits, or once the chunk store grew by `gc_growth_bytes` since the
+    last collection, whichever comes first. With `squash_after_days`, each
+    collection also rebuilds a side branch (default `<branch>-compacted`)
+    holding the history older than that window as a single commit.
+    """
+
+    gc_every_commits: Optional[int] = None
+    gc_growth_bytes: Optional[int] = None
+    squash_after_days: Optional[float] = None
+    squash_branch: Optional[str] = None
+
+
+@dataclass
+class MaintenanceMetrics:
+    commits: int = 0
+    size_before: int = 0
+    size_after: int = 0
+    gc_seconds: float = 0.0
+    squashed_commits: int = 0
+
+    def dict(self):
+        return dict(
+            commits=self.commits,
+            size_before=self.size_before,
+            size_after=self.size_after,
+            gc_seconds=self.gc_seconds,
+            squashed_commits=self.squashed_commits,
+        )
+
+
+def _state_path(repo_dir: str) -> str:
+    return os.path.join(repo_dir, ".dolt", STATE_FILE)
+
+
+def store_size(repo_dir: str) -> int:
+    """
+    Bytes used by the repository's chunk store.
+    """
+    total = 0
+    for root, _, files in os.walk(os.path.join(repo_dir, ".dolt", "noms")):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # removed by a concurrent gc
+    return total
+
+
+def read_maintenance_state(repo_dir: str) -> Optional[dict]:
+    try:
+        with open(_state_path(repo_dir), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(repo_dir: str, state: dict):
+    path = _state_path(repo_dir)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def enable_maintenance(db: Dolt, policy: MaintenancePolicy):
+    """
+    Opt the repository into `policy`. It is stored in `.dolt`, so every
+    process committing through the integrations applies it.
+    """
+    with repo_lock(db.repo_dir).exclusive():
+        _write_state(
+            db.repo_dir,
+            dict(policy=asdict(policy), commits=0, size_at_gc=store_size(db.repo_dir)),
+        )
+
+
+def disable_maintenance(db: Dolt):
+    with repo_lock(db.repo_dir).exclusive():
+        if os.path.exists(_state_path(db.repo_dir)):
+            os.remove(_state_path(db.repo_dir))
+
+
+def squash_history(
+    db: Dolt, before: datetime.datetime, side_branch: Optional[str] = None
+) -> int:
+    """
+    Point `side_branch` (default `<active branch>-compacted`) at a single
+    commit holding the active branch's state as of its last commit before
+    `before`, on top of the root commit. The branch itself is untouched.
+    Returns the number of commits squashed. Call holding the exclusive
+    repository lock.
+    """
+    commits = read_rows_sql(
+        db,
+        f"""
+        select
+            commit_hash
+        from
+            dolt_log
+        where
+            date < '{before.strftime("%Y-%m-%d %H:%M:%S")}'
+        order by
+            date desc
+    """,
+    )
+    if len(commits) < 3:
+        return 0
+
+    active_branch, _ = db._get_branches()
+    side_branch = side_branch or f"{active_branch.name}-compacted"
+    target, root = commits[0]["commit_hash"], commits[-1]["commit_hash"]
+    db.branch(side_branch, start_point=root, force=True)
+    db.checkout(side_branch)
+    try:
+        db.execute(["merge", "--squash", target])
+        db.add(".")
+        db.commit(f"Squashed {len(commits) - 1} commits up to {target}")
+    finally:
+        db.checkout(active_branch.name)
+    return len(commits) - 1
+
+
+def run_gc(db: Dolt, policy: Optional[MaintenancePolicy] = None) -> MaintenanceMetrics:
+    """
+    `dolt gc`, and the squash configured by `policy`, measuring the chunk
+    store before and after.
+    """
+    with repo_lock(db.repo_dir).exclusive():
+        metrics = MaintenanceMetrics(size_before=store_size(db.repo_dir))
+        if policy is not None and policy.squash_after_days is not None:
+            before = datetime.datetime.utcnow() - datetime.timedelta(
+                days=policy.squash_after_days
+            )
+            metrics.squashed_commits = squash_history(db, before, policy.squash_branch)
+
+        start = time.monotonic()
+        db.execute(["gc"])
+        metrics.gc_seconds = time.monotonic() - start
+        metrics.size_after = store_size(db.repo_dir)
+
+    logger.info(f"Maintenance of {db.repo_dir}: {metrics.dict()}")
+    return metrics
+
+
+def maintain(db: Dolt, commits: int = 1) -> Optional[MaintenanceMetrics]:
+    """
+    Count `commits` new automated commits against the repository's
+    maintenance policy, running `run_gc` when a threshold is crossed.
+    Without a policy (see `enable_maintenance`) this only checks for the
+    state file. Must not be called holding the repository's shared lock.
+    """
+    if not os.path.exists(_state_path(db.repo_dir)):
+        return None
+
+    with repo_lock(db.repo_dir).exclusive():
+        state = read_maintenance_state(db.repo_dir)
+        if state is None:
+            return None
+        policy = MaintenancePolicy(**state["policy"])
+        state["commits"] += commits
+
+        due = (
+            policy.gc_every_commits is not None
+            and state["commits"] >= policy.gc_every_commits
+        )
+        if not due and policy.gc_growth_bytes is not None:
+            growth = store_size(db.repo_dir) - state["size_at_gc"]
+            due = growth >= policy.gc_growth_bytes
+
+        metrics = None
+        if due:
+            metrics = run_gc(db, policy)
+            metrics.commits = state["commits"]
+            state.update(commits=0, size_at_gc=metrics.size_after)
+        _write_state(db.repo_dir, state)
+    return metrics
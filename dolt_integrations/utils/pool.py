@@ -0,0 +1,173 @@
+from contextlib import ExitStack, contextmanager
+from dataclasses import replace
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Iterator, Optional
+
+from doltcli import Dolt, DoltException, read_rows_sql
+
+from .lock import LockTimeout, RepoLock, repo_lock
+
+if TYPE_CHECKING:
+    from dolt_integrations.metaflow import DoltConfig
+
+logger = logging.getLogger()
+
+POOL_REMOTE = "integrations-pool"
+
+
+class ClonePool(object):
+    def __init__(
+        self,
+        database: str,
+        root: Optional[str] = None,
+        size: int = 4,
+        poll_interval: float = 0.1,
+    ):
+        """
+        Local clones of `database` that tasks lease one at a time, so
+        parallel tasks on a host each get their own working set instead of
+        checking out branches in the shared directory. Clones are made on
+        first use and reused: a lease fetches, checks out the requested
+        branch and resets it to the requested commit.
+
+        The source pushes to a file remote under `root` (default: a
+        `<database>.pool` directory beside it) that every clone tracks as
+        `origin`. Leases are held with `flock`, so processes on the host
+        share the pool.
+        """
+        self.database = os.path.realpath(database)
+        self.root = root or f"{self.database}.pool"
+        self.size = size
+        self.poll_interval = poll_interval
+        self.remote_url = f"file://{os.path.join(self.root, 'remote')}"
+        os.makedirs(os.path.join(self.root, "remote"), exist_ok=True)
+
+    def _slot_lock(self, slot: int) -> RepoLock:
+        path = os.path.join(self.root, "slots", str(slot))
+        os.makedirs(path, exist_ok=True)
+        return repo_lock(path)
+
+    def _clone_dir(self, slot: int) -> str:
+        return os.path.join(self.root, f"clone-{slot}")
+
+    def _push_source(self, source: Dolt, branch: str):
+        try:
+            source.remote(add=True, name=POOL_REMOTE, url=self.remote_url)
+        except DoltException:
+            pass  # already added
+        # published commits are merged into the source before the lock is
+        # released, so the remote never holds commits the source lacks
+        source.push(POOL_REMOTE, branch)
+
+    def _sync(self, branch: str):
+        with repo_lock(self.database).shared():
+            self._push_source(Dolt(self.database), branch)
+
+    @contextmanager
+    def _acquire_slot(self, timeout: Optional[float]) -> Iterator[int]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            for slot in range(self.size):
+                lock = self._slot_lock(slot)
+                if lock.held:
+                    continue  # leased by this thread already
+                with ExitStack() as stack:
+                    try:
+                        stack.enter_context(lock.exclusive(timeout=0))
+                    except LockTimeout:
+                        continue
+                    yield slot
+                    return
+            if deadline is not None and time.monotonic() >= deadline:
+                raise LockTimeout(f"No free clone of {self.database} in {self.root}")
+            time.sleep(self.poll_interval)
+
+    def _prepare(self, slot: int, branch: str, commit: Optional[str]) -> Dolt:
+        path = self._clone_dir(slot)
+        if not os.path.isdir(os.path.join(path, ".dolt")):
+            logger.info(f"Cloning {self.database} into {path}")
+            db = Dolt.clone(self.remote_url, new_dir=path)
+        else:
+            db = Dolt(path)
+            db.fetch("origin", force=True)
+
+        active, branches = db.branch()
+        if branch == active.name:
+            pass
+        elif branch in [b.name for b in branches]:
+            db.checkout(branch)
+        else:
+            db.checkout(branch, start_point=f"origin/{branch}", checkout_branch=True)
+        db.execute(["reset", "--hard", commit or f"origin/{branch}"])
+        return db
+
+    def _publish(self, db: Dolt, branch: str):
+        source = Dolt(self.database)
+        remote_ref = f"{POOL_REMOTE}/{branch}"
+        with repo_lock(self.database).exclusive():
+            # commits made on the source since the lease make the push below
+            # a non-fast-forward, which the remote rejects
+            self._push_source(source, branch)
+            try:
+                db.push("origin", branch)
+            except DoltException as e:
+                raise ValueError(
+                    f"Cannot publish {branch}, it has diverged in {self.database}"
+                ) from e
+
+            source.fetch(POOL_REMOTE, branch)
+            res = read_rows_sql(
+                source,
+                f"""
+                select
+                    hashof('{branch}') as head,
+                    dolt_merge_base('{branch}', '{remote_ref}') as base
+            """,
+            )
+            if res[0]["head"] != res[0]["base"]:
+                raise ValueError(f"Cannot fast-forward {branch} to {remote_ref}")
+
+            active, _ = source.branch()
+            if active.name == branch:
+                # Dolt.merge only accepts local branch names
+                source.execute(["merge", remote_ref])
+            else:
+                source.branch(branch, start_point=remote_ref, force=True)
+
+    @contextmanager
+    def lease(
+        self,
+        branch: str = "master",
+        commit: Optional[str] = None,
+        publish: bool = False,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Dolt]:
+        """
+        A clone at `commit` (default: the tip of `branch` in the source),
+        checked out on `branch`. With `publish`, commits made on the clone
+        are pushed back and the source's `branch` is fast-forwarded to
+        them when the lease ends without error; if the source's `branch`
+        got other commits since, `ValueError` is raised and it is left as is.
+        """
+        self._sync(branch)
+        with self._acquire_slot(timeout) as slot:
+            db = self._prepare(slot, branch, commit)
+            yield db
+            if publish:
+                self._publish(db, branch)
+
+    @contextmanager
+    def lease_config(
+        self,
+        config: "DoltConfig",
+        publish: bool = False,
+        timeout: Optional[float] = None,
+    ) -> Iterator["DoltConfig"]:
+        """
+        `config` pointed at a leased clone, for a DoltDT. Audits record the
+        clone's directory as the database.
+        """
+        with self.lease(config.branch, config.commit, publish, timeout) as db:
+            yield replace(config, database=db.repo_dir)
@@ -0,0 +1,157 @@
+import os
+from typing import Dict, Optional
+
+from doltcli import Dolt
+
+
+class DoltSession(Dolt):
+    def __init__(self, repo_dir: str, print_output: Optional[bool] = None):
+        """
+        Dolt handle that tracks its active branch, head and branch list
+        locally. Values are queried once, then kept current from the results
+        of the session's own checkouts and commits instead of being looked up
+        again. Changes made outside the session are only picked up after
+        `revalidate`.
+        """
+        super().__init__(repo_dir=repo_dir, print_output=print_output)
+        self._head: Optional[str] = None
+        self._branch: Optional[str] = None
+        self._branches: Optional[Dict[str, str]] = None
+
+    @property
+    def repo_name(self) -> str:
+        # the last component of "." or a path ending in "/" is not the name
+        return os.path.basename(os.path.realpath(self.repo_dir)).replace("-", "_")
+
+    @classmethod
+    def of(cls, db: Dolt) -> "DoltSession":
+        return db if isinstance(db, DoltSession) else cls(db.repo_dir)
+
+    def revalidate(self):
+        self._head = None
+        self._branch = None
+        self._branches = None
+
+    @property
+    def head(self) -> str:
+        if self._head is None:
+            self._head = super().head
+        return self._head
+
+    @property
+    def active_branch(self) -> str:
+        if self._branch is None:
+            self._branch = super().active_branch
+        return self._branch
+
+    @property
+    def branches(self) -> Dict[str, str]:
+        """
+        Branch name -> head commit.
+        """
+        if self._branches is None:
+            res = self.sql("select name, hash from dolt_branches", result_format="csv")
+            self._branches = {r["name"]: r["hash"] for r in res}
+        return self._branches
+
+    def checkout(
+        self,
+        branch: Optional[str] = None,
+        tables=None,
+        checkout_branch: bool = False,
+        start_point: Optional[str] = None,
+        **kwargs,
+    ):
+        self.revalidate()
+        super().checkout(
+            branch=branch,
+            tables=tables,
+            checkout_branch=checkout_branch,
+            start_point=start_point,
+            **kwargs,
+        )
+        # with error=False a failed checkout is silent, so the branch is unknown
+        if branch is not None and not tables and kwargs.get("error", True):
+            self._branch = branch
+
+    def sql_checkout(self, branch: str, create: bool = False):
+        args = f"'-b', '{branch}'" if create else f"'{branch}'"
+        self.sql(f"call dolt_checkout({args})", result_format="csv")
+
+        if create and self._head is not None and self._branches is not None:
+            self._branches[branch] = self._head
+        self._head = (self._branches or {}).get(branch)
+        self._branch = branch
+
+    def sql_commit(self, message: str) -> str:
+        res = self.sql(f"call dolt_commit('-m', '{message}')", result_format="csv")
+        self._head = res[0]["hash"]
+        if self._branches is not None and self._branch is not None:
+            self._branches[self._branch] = self._head
+        return self._head
+
+
+class BranchSession(DoltSession):
+    def __init__(self, repo_dir: str, branch: str, print_output: Optional[bool] = None):
+        """
+        Dolt handle whose SQL runs against `branch` through its revision
+        database (`USE <repo>/<branch>`), so reads, writes and commits are
+        scoped to each `dolt sql` session and the checked out branch of the
+        working directory never moves. Commands other than `sql` (table
+        import/export, ls) still see the checked out branch.
+        """
+        super().__init__(repo_dir=repo_dir, print_output=print_output)
+        self.branch = branch
+        self._branch = branch
+
+    @property
+    def use_statement(self) -> str:
+        return f"USE `{self.repo_name}/{self.branch}`;"
+
+    def revalidate(self):
+        super().revalidate()
+        self._branch = self.branch
+
+    def sql(self, query: Optional[str] = None, *args, **kwargs):
+        if query is not None:
+            query = f"{self.use_statement} {query}"
+        return super().sql(query, *args, **kwargs)
+
+
+class MultiDatabaseSession(Dolt):
+    def __init__(self, data_dir: str, print_output: Optional[bool] = None):
+        """
+        Dolt handle whose SQL runs with every repository in `data_dir` served
+        as a database named after its directory (`dolt sql --multi-db-dir`),
+        so one query can join tables of several repositories. Use `revision`
+        to reference a repository's tables at a branch or commit. Nothing
+        restricts a query to particular repositories: callers lock the ones
+        they reference.
+        """
+        self.data_dir = os.path.realpath(data_dir)
+        repos = sorted(
+            name
+            for name in os.listdir(self.data_dir)
+            if os.path.isdir(os.path.join(self.data_dir, name, ".dolt"))
+        )
+        if not repos:
+            raise ValueError(f"No Dolt databases in {self.data_dir}")
+        # commands need a repository to run in; --multi-db-dir takes precedence
+        super().__init__(os.path.join(self.data_dir, repos[0]), print_output)
+
+    @staticmethod
+    def database_name(repo_dir: str) -> str:
+        return os.path.basename(os.path.realpath(repo_dir)).replace("-", "_")
+
+    def revision(self, repo_dir: str, revision: str) -> str:
+        """
+        Qualifier for the revision database of `repo_dir` at `revision`, as
+        in `SELECT * FROM <qualifier>.table`.
+        """
+        if os.path.dirname(os.path.realpath(repo_dir)) != self.data_dir:
+            raise ValueError(f"{repo_dir} is not a database in {self.data_dir}")
+        return f"`{self.database_name(repo_dir)}/{revision}`"
+
+    def sql(self, query: Optional[str] = None, *args, **kwargs):
+        kwargs.setdefault("multi_db_dir", self.data_dir)
+        return super().sql(query, *args, **kwargs)
@@ -0,0 +1,124 @@
+from dataclasses import dataclass, field
+import json
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from doltcli import Dolt
+
+from .session import BranchSession
+from .utils import TEXT_TYPES, get_column_types
+
+STATS_DIR = "integrations.stats"
+# pandas bytes per value: fixed-width columns, and a str object before its text
+FIXED_WIDTH_BYTES = 8
+TEXT_OVERHEAD_BYTES = 49
+
+
+class ReadBudgetExceeded(MemoryError):
+    pass
+
+
+@dataclass
+class TableStats:
+    """
+    Size of a table at one commit. `bytes` estimates the memory of the
+    table read into a DataFrame with default dtypes.
+    """
+
+    table: str
+    commit: str
+    rows: int
+    bytes: int
+    column_types: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def row_bytes(self) -> int:
+        return self.bytes // self.rows if self.rows else 0
+
+    def dict(self):
+        return dict(
+            table=self.table,
+            commit=self.commit,
+            rows=self.rows,
+            bytes=self.bytes,
+            column_types=self.column_types,
+        )
+
+
+_cache: Dict[Tuple[str, str, str], TableStats] = {}
+_cache_guard = threading.Lock()
+
+
+def _stats_path(repo_dir: str, table: str, commit: str) -> str:
+    return os.path.join(repo_dir, ".dolt", STATS_DIR, f"{table}@{commit}.json")
+
+
+def _read_stats_file(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _compute_stats(db: Dolt, table: str, commit: str) -> TableStats:
+    session = BranchSession(db.repo_dir, commit)
+    column_types = get_column_types(session, table)
+    text = [
+        col
+        for col, kind in column_types.items()
+        if kind.split("(")[0].split()[0].lower() in TEXT_TYPES
+    ]
+    lengths = "".join(
+        f", avg(length(`{col}`)) as `len_{i}`" for i, col in enumerate(text)
+    )
+    res = session.sql(
+        f"select count(*) as `rows`{lengths} from `{table}`", result_format="csv"
+    )[0]
+
+    row_bytes = FIXED_WIDTH_BYTES * (len(column_types) - len(text) + 1)  # + index
+    for i in range(len(text)):
+        row_bytes += TEXT_OVERHEAD_BYTES + int(float(res[f"len_{i}"] or 0))
+    rows = int(res["rows"])
+    return TableStats(table, commit, rows, rows * row_bytes, column_types)
+
+
+def table_stats(db: Dolt, table: str, commit: Optional[str] = None) -> TableStats:
+    """
+    Row count, estimated bytes and column types of `table` at `commit`
+    (default: HEAD). Commits are immutable, so stats are computed with one
+    scan the first time and then served from memory or from a cache file
+    per table and commit in `.dolt`, shared by every process.
+    """
+    commit = commit or db.head
+    key = (os.path.realpath(db.repo_dir), table, commit)
+    with _cache_guard:
+        if key in _cache:
+            return _cache[key]
+
+    path = _stats_path(db.repo_dir, table, commit)
+    stored = _read_stats_file(path)
+    if stored is not None:
+        stats = TableStats(**stored)
+    else:
+        stats = _compute_stats(db, table, commit)
+        # one file per entry, so concurrent writers never drop each other's
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(stats.dict(), f)
+        os.replace(tmp, path)
+
+    with _cache_guard:
+        _cache[key] = stats
+    return stats
+
+
+def check_read_budget(stats: TableStats, budget: int):
+    if stats.bytes > budget:
+        raise ReadBudgetExceeded(
+            f"Reading {stats.table} at {stats.commit} would take about "
+            f"{stats.bytes} bytes ({stats.rows} rows), over the memory budget "
+            f"of {budget} bytes. Read it in chunks or raise the budget."
+        )
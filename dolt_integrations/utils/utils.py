@@ -1,37 +1,848 @@
-import pandas as pd
+from dataclasses import dataclass
 import datetime
-from typing import Optional, List
-from doltcli import Dolt
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import TYPE_CHECKING, Dict, Iterator, Optional, List, Tuple, Union
+from doltcli import Dolt, DoltException
 from doltcli.utils import (  # type: ignore
-    _import_helper,
+    CREATE,
+    FORCE_CREATE,
+    IMPORT_MODES_TO_FLAGS,
+    REPLACE,
+    UPDATE,
     get_read_table_asof_query,
     read_table_sql,
 )
 
+from .session import BranchSession, MultiDatabaseSession
 
-def parse_to_pandas(sql_output: str) -> pd.DataFrame:
-    return pd.read_csv(sql_output)
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
 
+logger = logging.getLogger()
 
-def read_pandas_sql(dolt: Dolt, sql: str) -> pd.DataFrame:
-    return read_table_sql(dolt, sql, result_parser=parse_to_pandas)
+# longer queries go to `dolt sql` on stdin, under Linux's 128KiB per argument
+SQL_ARG_MAX_BYTES = 100000
 
+INT_BITS = {"tinyint": 8, "smallint": 16, "mediumint": 32, "int": 32, "bigint": 64}
+FLOAT_TYPES = {"float", "double", "decimal"}
+TEXT_TYPES = {"char", "varchar", "tinytext", "text", "mediumtext", "longtext", "enum"}
 
-def read_pandas(dolt: Dolt, table: str, as_of: str = None) -> pd.DataFrame:
-    return read_pandas_sql(dolt, get_read_table_asof_query(table, as_of))
+
+@dataclass
+class DtypePolicy:
+    """
+    How columns are narrowed after a read. Integers take the smallest
+    width holding their values, text columns with at most
+    `category_ratio` distinct values per row become categoricals, and
+    other text optionally becomes a `pd.StringDtype` ("python" or
+    "pyarrow"). Dolt column types, when known, decide which columns are
+    integers even if nulls made them floats.
+    """
+
+    nullable_ints: bool = True
+    float32: bool = False
+    category_ratio: float = 0.5
+    string_storage: Optional[str] = None
+
+
+def get_column_types(dolt: Dolt, table: str) -> Dict[str, str]:
+    rows = read_table_sql(
+        dolt,
+        f"""
+        select
+            column_name as name,
+            column_type as type
+        from
+            information_schema.columns
+        where
+            table_schema = database()
+            and table_name = '{table}'
+        order by
+            ordinal_position
+    """,
+    )
+    return {r["name"]: r["type"] for r in rows}
+
+
+def _get_int_dtype(series: "pd.Series", unsigned: bool, nullable: bool):
+    import numpy as np
+
+    values = series.dropna()
+    if len(values) and not (values == values.round()).all():
+        return None
+    low, high = (values.min(), values.max()) if len(values) else (0, 0)
+
+    prefix = "u" if unsigned else ""
+    for bits in (8, 16, 32, 64):
+        info = np.iinfo(f"{prefix}int{bits}")
+        if info.min <= low and high <= info.max:
+            break
+    if nullable:
+        return f"{prefix.upper()}Int{bits}"
+    return None if series.hasnans else f"{prefix}int{bits}"
+
+
+def get_pandas_dtype(
+    series: "pd.Series", policy: DtypePolicy, column_type: Optional[str] = None
+):
+    """
+    Narrowest dtype for `series` under `policy`, or None to leave it as
+    parsed. Without a `column_type` the kind is inferred from the parsed
+    dtype, so integer columns holding nulls stay float.
+    """
+    import pandas as pd
+
+    kind = column_type.split("(")[0].split()[0].lower() if column_type else None
+    if kind in INT_BITS or (kind is None and pd.api.types.is_integer_dtype(series)):
+        unsigned = column_type is not None and "unsigned" in column_type
+        return _get_int_dtype(series, unsigned, policy.nullable_ints)
+
+    if kind in FLOAT_TYPES or (kind is None and pd.api.types.is_float_dtype(series)):
+        return "float32" if policy.float32 or kind == "float" else None
+
+    is_text = pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(
+        series
+    )
+    if kind in TEXT_TYPES or (kind is None and is_text):
+        if kind == "enum" or series.nunique() <= policy.category_ratio * len(series):
+            return "category"
+        if policy.string_storage:
+            return pd.StringDtype(policy.string_storage)
+    return None
+
+
+def apply_dtype_policy(
+    df: "pd.DataFrame",
+    policy: DtypePolicy,
+    column_types: Optional[Dict[str, str]] = None,
+) -> "pd.DataFrame":
+    """
+    Convert `df` in place per `policy`. The bytes saved are logged and kept
+    in `df.attrs["memory_saved"]`.
+
+    :param df:
+    :param policy:
+    :param column_types: column -> Dolt column type, e.g. `int unsigned`
+    :return:
+    """
+    column_types = column_types or {}
+    before = df.memory_usage(deep=True).sum()
+    for col in df.columns:
+        dtype = get_pandas_dtype(df[col], policy, column_types.get(col))
+        if dtype is not None:
+            df[col] = df[col].astype(dtype)
+
+    saved = int(before - df.memory_usage(deep=True).sum())
+    df.attrs["memory_saved"] = saved
+    logger.info(f"Dtype policy saved {saved} bytes ({before} before)")
+    return df
+
+
+def parse_to_pandas(sql_output: str) -> "pd.DataFrame":
+    import pandas as pd
+
+    try:
+        return pd.read_csv(sql_output)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame()
+
+
+def read_pandas_sql(
+    dolt: Dolt,
+    sql: str,
+    dtypes: Optional[DtypePolicy] = None,
+    column_types: Optional[Dict[str, str]] = None,
+) -> "pd.DataFrame":
+    if len(sql) > SQL_ARG_MAX_BYTES:
+        output = execute_sql_script(dolt, sql, result_format="csv")
+        df = parse_to_pandas(io.StringIO(output))
+    else:
+        df = read_table_sql(dolt, sql, result_parser=parse_to_pandas)
+    if dtypes is not None:
+        apply_dtype_policy(df, dtypes, column_types)
+    return df
+
+
+def read_pandas(
+    dolt: Dolt, table: str, as_of: str = None, dtypes: Optional[DtypePolicy] = None
+) -> "pd.DataFrame":
+    column_types = None
+    if dtypes is not None:
+        # the schema may have changed since `as_of`
+        schema = dolt if as_of is None else BranchSession(dolt.repo_dir, as_of)
+        column_types = get_column_types(schema, table)
+    return read_pandas_sql(
+        dolt, get_read_table_asof_query(table, as_of), dtypes, column_types
+    )
+
+
+def read_pandas_chunks(
+    dolt: Dolt, sql: str, chunksize: int
+) -> Iterator["pd.DataFrame"]:
+    """
+    DataFrames of at most `chunksize` rows of the result of `sql`. The query
+    runs right away and its output is spilled to a temporary file that is
+    parsed lazily and removed once the iterator is exhausted or closed.
+    """
+    import pandas as pd
+
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        dolt.sql(sql, result_format="csv", result_file=path)
+    except Exception:
+        os.remove(path)
+        raise
+
+    def chunks():
+        try:
+            for chunk in pd.read_csv(path, chunksize=chunksize):
+                yield chunk
+        except pd.errors.EmptyDataError:
+            return
+        finally:
+            os.remove(path)
+
+    return chunks()
+
+
+def read_numpy(
+    dolt: Dolt,
+    sql: str,
+    dtypes: Optional[Dict[str, "np.dtype"]] = None,
+    chunksize: int = 1000000,
+) -> Dict[str, "np.ndarray"]:
+    """
+    Read the result of `sql` as one contiguous array per column, without
+    building Python rows. Chunks from the C CSV parser are copied into
+    arrays preallocated per column, which grow geometrically and are
+    trimmed at the end. Numeric and boolean `dtypes` are applied by the
+    parser itself, other dtypes (e.g. `U8`) on conversion. An array is
+    promoted when a later chunk needs a wider dtype, e.g. an int column
+    that turns float with its first null, or longer strings for `U`.
+
+    :param dolt:
+    :param sql:
+    :param dtypes: column -> NumPy dtype, default inferred per column
+    :param chunksize: rows parsed per chunk
+    :return:
+    """
+    import numpy as np
+    import pandas as pd
+
+    dtypes = {col: np.dtype(dtype) for col, dtype in (dtypes or {}).items()}
+    parse_dtypes = {col: d for col, d in dtypes.items() if d.kind in "biuf"}
+
+    def parser(sql_output: str) -> Dict[str, "np.ndarray"]:
+        arrays: Dict[str, "np.ndarray"] = {}
+        rows = 0
+        try:
+            reader = pd.read_csv(sql_output, dtype=parse_dtypes, chunksize=chunksize)
+            for chunk in reader:
+                n = len(chunk)
+                for col in chunk.columns:
+                    values = chunk[col].to_numpy(dtypes.get(col))
+                    if col not in arrays:
+                        arrays[col] = np.empty(max(n, chunksize), dtype=values.dtype)
+                    else:
+                        dtype = np.result_type(arrays[col].dtype, values.dtype)
+                        if dtype != arrays[col].dtype:
+                            arrays[col] = arrays[col].astype(dtype)
+                        if rows + n > len(arrays[col]):
+                            size = max(rows + n, 2 * rows)
+                            arrays[col].resize(size, refcheck=False)
+                    arrays[col][rows : rows + n] = values
+                rows += n
+        except pd.errors.EmptyDataError:
+            return {}
+
+        for array in arrays.values():
+            array.resize(rows, refcheck=False)
+        return arrays
+
+    return read_table_sql(dolt, sql, result_parser=parser)
+
+
+DECOMPOSABLE_AGGREGATES = {"count", "sum", "mean", "min", "max"}
+
+
+def aggregate_pandas_sql(
+    dolt: Dolt,
+    sql: str,
+    group_by: List[str],
+    aggs: Dict[str, Tuple[str, str]],
+    chunksize: int = 100000,
+) -> "pd.DataFrame":
+    """
+    Aggregate the result of `sql` client-side without holding it in memory
+    at once. Rows must come back ordered by `group_by`: each chunk's
+    completed groups are aggregated straight away and only the trailing,
+    possibly incomplete, group is carried into the next chunk, so any
+    pandas aggregation (median, nunique, ...) is computed exactly. Without
+    `group_by`, count, sum, mean, min and max are reduced chunk by chunk;
+    other aggregations keep their input column in memory.
+
+    :param dolt:
+    :param sql: query returning `group_by` and aggregated columns
+    :param group_by: grouping columns, may be empty to aggregate all rows
+    :param aggs: output column -> (input column, pandas aggregation)
+    :param chunksize: rows parsed per chunk
+    :return:
+    """
+    import pandas as pd
+
+    aggs = {name: tuple(agg) for name, agg in aggs.items()}
+
+    def aggregate(df: "pd.DataFrame") -> "pd.DataFrame":
+        if group_by:
+            grouped = df.groupby(group_by, sort=False, dropna=False)
+            return grouped.agg(**aggs).reset_index()
+        return pd.DataFrame(
+            {name: [df[col].agg(func)] for name, (col, func) in aggs.items()}
+        )
+
+    def reduce_all(chunks) -> "pd.DataFrame":
+        partials = {name: [] for name in aggs}
+        for chunk in chunks:
+            for name, (col, func) in aggs.items():
+                values = chunk[col]
+                if func == "mean":
+                    partials[name].append((values.sum(), values.count()))
+                elif func in DECOMPOSABLE_AGGREGATES:
+                    partials[name].append(values.agg(func))
+                else:
+                    partials[name].append(values)
+        if not any(partials.values()):
+            return pd.DataFrame(columns=list(aggs))
+
+        row = {}
+        for name, (col, func) in aggs.items():
+            if func == "mean":
+                total, count = map(sum, zip(*partials[name]))
+                row[name] = [total / count if count else float("nan")]
+            elif func in DECOMPOSABLE_AGGREGATES:
+                # counts and sums add up, minima and maxima of minima and maxima
+                combine = "sum" if func == "count" else func
+                row[name] = [pd.Series(partials[name]).agg(combine)]
+            else:
+                row[name] = [pd.concat(partials[name]).agg(func)]
+        return pd.DataFrame(row)
+
+    def parser(sql_output: str) -> "pd.DataFrame":
+        if not group_by:
+            return reduce_all(pd.read_csv(sql_output, chunksize=chunksize))
+
+        results, carry = [], None
+        for chunk in pd.read_csv(sql_output, chunksize=chunksize):
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+
+            last = chunk[group_by].iloc[-1]
+            in_last = pd.Series(True, index=chunk.index)
+            for col in group_by:
+                values = chunk[col]
+                same = values.isna() if pd.isna(last[col]) else values == last[col]
+                in_last &= same
+            carry = chunk[in_last]
+            if not in_last.all():
+                results.append(aggregate(chunk[~in_last]))
+
+        if carry is not None:
+            results.append(aggregate(carry))
+        if not results:
+            return pd.DataFrame(columns=group_by + list(aggs))
+        return pd.concat(results, ignore_index=True)
+
+    try:
+        return read_table_sql(dolt, sql, result_parser=parser)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame(columns=group_by + list(aggs))
+
+
+def get_table_columns(dolt: Dolt, table: str) -> List[str]:
+    rows = read_table_sql(
+        dolt,
+        f"""
+        select
+            column_name as name
+        from
+            information_schema.columns
+        where
+            table_schema = database()
+            and table_name = '{table}'
+        order by
+            ordinal_position
+    """,
+    )
+    return [r["name"] for r in rows]
+
+
+def get_asof_join_query(
+    labels: str, features: str, on: List[str], label_time: str, columns: List[str]
+) -> str:
+    """
+    SQL joining each row of `labels` to the `features` row with the same
+    `on` keys as of the last commit on the current branch at or before the
+    label's `label_time`. The matched commit is returned as `asof_commit`.
+    """
+    projection = ", ".join(f"h.`{c}`" for c in columns)
+    conditions = " AND ".join(f"h.`{c}` = lc.`{c}`" for c in on)
+    return f"""
+        WITH label_commits AS (
+            SELECT
+                l.*,
+                (
+                    SELECT commit_hash FROM dolt_log
+                    WHERE date <= l.`{label_time}`
+                    ORDER BY date DESC LIMIT 1
+                ) AS asof_commit
+            FROM `{labels}` AS l
+        )
+        SELECT
+            lc.*, {projection}
+        FROM
+            label_commits AS lc
+            LEFT JOIN `dolt_history_{features}` AS h
+            ON h.commit_hash = lc.asof_commit AND {conditions}
+    """
+
+
+def asof_join(
+    dolt: Dolt,
+    labels: Union[str, "pd.DataFrame"],
+    features: str,
+    on: List[str],
+    label_time: str,
+    columns: Optional[List[str]] = None,
+    in_sql: bool = True,
+    chunksize: int = 100000,
+) -> "pd.DataFrame":
+    """
+    Point-in-time join of labels to the values `features` had at each
+    label's timestamp, read from `dolt_history_<features>`.
+
+    With `in_sql` and `labels` naming a table, the as-of logic runs inside
+    Dolt (see `get_asof_join_query`) and only the joined rows are returned.
+    Otherwise only the keys, requested columns and commit dates of the
+    history are read and matched with `pd.merge_asof` one chunk at a time,
+    keeping the latest match per label, so memory is bounded by the labels
+    and one chunk. That path takes the latest version of each row committed at or before the
+    label time, so unlike the SQL path it still matches rows that were
+    deleted before then.
+
+    :param dolt:
+    :param labels: table name, or a DataFrame (which implies in_sql=False)
+    :param features: table whose history is joined
+    :param on: key columns shared by labels and features
+    :param label_time: datetime column of labels
+    :param columns: feature columns to return, default all non-key columns
+    :param in_sql:
+    :param chunksize: rows per chunk when reading history client-side
+    :return:
+    """
+    import pandas as pd
+
+    if columns is None:
+        columns = [c for c in get_table_columns(dolt, features) if c not in on]
+
+    if in_sql and isinstance(labels, str):
+        query = get_asof_join_query(labels, features, on, label_time, columns)
+        return read_pandas_sql(dolt, query)
+
+    if isinstance(labels, str):
+        labels = read_pandas(dolt, labels)
+    labels = labels.assign(**{label_time: pd.to_datetime(labels[label_time])})
+    labels = labels.sort_values(label_time).reset_index(drop=True)
+
+    projection = ", ".join(f"`{c}`" for c in on + columns)
+    query = f"SELECT {projection}, commit_date FROM `dolt_history_{features}`"
+
+    def parser(sql_output: str) -> "pd.DataFrame":
+        # latest history row per label position, across the chunks seen so far
+        best = pd.DataFrame(columns=columns + ["commit_date"])
+        try:
+            chunks = pd.read_csv(
+                sql_output, chunksize=chunksize, parse_dates=["commit_date"]
+            )
+            for chunk in chunks:
+                matched = pd.merge_asof(
+                    labels[on + [label_time]],
+                    chunk.sort_values("commit_date"),
+                    left_on=label_time,
+                    right_on="commit_date",
+                    by=on,
+                    direction="backward",
+                )
+                matched = matched.loc[
+                    matched["commit_date"].notna(), columns + ["commit_date"]
+                ]
+                best = pd.concat([best, matched]) if len(best) else matched
+                best = best.sort_values("commit_date", kind="stable")
+                best = best[~best.index.duplicated(keep="last")]
+        except pd.errors.EmptyDataError:
+            pass
+        return best
+
+    return labels.join(read_table_sql(dolt, query, result_parser=parser))
+
+
+INT_TYPES = {1: "tinyint", 2: "smallint", 4: "int", 8: "bigint"}
+MIN_KEY_LENGTH = 255
+MAX_KEY_LENGTH = 16383
+
+
+def get_dolt_type(series: "pd.Series", is_key: bool = False) -> str:
+    """
+    Map a pandas column to the Dolt column type it should be created with.
+    Text columns become `longtext`, or a `varchar` wide enough for the
+    longest value when they are part of the primary key.
+    """
+    dtype = series.dtype
+    if dtype.kind == "b":
+        return "tinyint"
+    elif dtype.kind in "iu":
+        sql_type = INT_TYPES.get(getattr(dtype, "itemsize", 8), "bigint")
+        return f"{sql_type} unsigned" if dtype.kind == "u" else sql_type
+    elif dtype.kind == "f":
+        return "float" if getattr(dtype, "itemsize", 8) <= 4 else "double"
+    elif dtype.kind == "M":
+        return "datetime(6)"
+    elif is_key:
+        longest = series.astype(str).str.len().max() if len(series) else 0
+        return f"varchar({min(max(MIN_KEY_LENGTH, longest), MAX_KEY_LENGTH)})"
+    return "longtext"
+
+
+def get_create_table_sql(
+    table: str,
+    df: "pd.DataFrame",
+    primary_key: List[str],
+    type_overrides: Optional[Dict[str, str]] = None,
+) -> str:
+    """
+    Build a `CREATE TABLE` statement from DataFrame dtypes, with
+    `type_overrides` taking precedence for the columns it names.
+    """
+    type_overrides = type_overrides or {}
+    unknown = set(type_overrides) - set(df.columns)
+    if unknown:
+        raise ValueError(f"Type overrides for columns not in DataFrame: {unknown}")
+
+    columns = []
+    for col in df.columns:
+        is_key = col in primary_key
+        sql_type = type_overrides.get(col) or get_dolt_type(df[col], is_key=is_key)
+        columns.append(f"`{col}` {sql_type}{' NOT NULL' if is_key else ''}")
+
+    keys = ", ".join(f"`{col}`" for col in primary_key)
+    columns.append(f"PRIMARY KEY ({keys})")
+    body = ",\n    ".join(columns)
+    return f"CREATE TABLE `{table}` (\n    {body}\n);\n"
+
+
+def _import_with_schema(
+    dolt: Dolt,
+    table: str,
+    write_import_file,
+    schema: Optional[str],
+    import_mode: str,
+    commit: Optional[bool] = False,
+    commit_message: Optional[str] = None,
+    commit_date: Optional[datetime.datetime] = None,
+    primary_key: Optional[List[str]] = None,
+):
+    # doltcli's _import_helper would replace import_mode with its default
+    d = tempfile.mkdtemp()
+    try:
+        args = ["table", "import", table] + IMPORT_MODES_TO_FLAGS[import_mode]
+        if schema is not None:
+            schema_file = os.path.join(d, "schema.sql")
+            with open(schema_file, "w") as f:
+                f.write(schema)
+            args.append(f"--schema={schema_file}")
+        if primary_key:
+            args.append(f"--pk={','.join(primary_key)}")
+
+        fname = os.path.join(d, "import.csv")
+        write_import_file(fname)
+        dolt.execute(args + [fname])
+
+        if commit:
+            msg = (
+                commit_message
+                or f"Committing write to table {table} in {import_mode} mode"
+            )
+            dolt.add(table)
+            dolt.commit(msg, date=commit_date)
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+BULK_INSERT_MAX_ROWS = 100000
+INSERT_BATCH_SIZE = 5000
+
+
+def get_sql_literals(series: "pd.Series") -> "pd.Series":
+    """
+    Render a column as SQL literals with whole-column string operations.
+    """
+    import numpy as np
+    import pandas as pd
+
+    nulls = series.isna().values
+    kind = series.dtype.kind
+    if kind == "b":
+        literals = pd.Series(np.where(series.values, "1", "0"), index=series.index)
+    elif kind in "iuf":
+        literals = series.astype(str)
+    elif kind == "M":
+        literals = series.dt.strftime("'%Y-%m-%d %H:%M:%S.%f'")
+    else:
+        escaped = (
+            series.astype(str)
+            .str.replace("\\", "\\\\", regex=False)
+            .str.replace("'", "\\'", regex=False)
+        )
+        literals = "'" + escaped + "'"
+
+    if nulls.any():
+        literals = literals.astype(object).where(~nulls, "NULL")
+    return literals
+
+
+def get_insert_sql(
+    table: str,
+    df: "pd.DataFrame",
+    batch_size: int = INSERT_BATCH_SIZE,
+) -> List[str]:
+    """
+    Render `df` as multi-row `INSERT ... ON DUPLICATE KEY UPDATE` statements
+    of at most `batch_size` rows each.
+    """
+    if len(df) == 0:
+        return []
+
+    rows = None
+    for col in df.columns:
+        literals = get_sql_literals(df[col])
+        rows = literals if rows is None else rows + ", " + literals
+    rows = ("(" + rows + ")").values
+
+    columns = ", ".join(f"`{col}`" for col in df.columns)
+    updates = ", ".join(f"`{col}` = VALUES(`{col}`)" for col in df.columns)
+    return [
+        f"INSERT INTO `{table}` ({columns}) VALUES\n"
+        + ",\n".join(rows[i : i + batch_size])
+        + f"\nON DUPLICATE KEY UPDATE {updates};"
+        for i in range(0, len(rows), batch_size)
+    ]
+
+
+def execute_sql_script(
+    dolt: Dolt, script: str, result_format: Optional[str] = None
+) -> str:
+    """
+    Run a multi-statement script in a single `dolt sql` session. The script
+    is sent on stdin, which sidesteps the per-argument length limit that
+    `dolt sql -q` runs into for large batches.
+    """
+    if isinstance(dolt, BranchSession):
+        script = f"{dolt.use_statement}\n{script}"
+
+    args = ["dolt", "sql"]
+    if isinstance(dolt, MultiDatabaseSession):
+        args += ["--multi-db-dir", dolt.data_dir]
+    if result_format is not None:
+        args += ["--result-format", result_format]
+    proc = subprocess.run(
+        args,
+        input=script.encode("utf-8"),
+        cwd=dolt.repo_dir,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if proc.returncode != 0:
+        raise DoltException(" ".join(args), proc.stdout, proc.stderr, proc.returncode)
+    return proc.stdout.decode("utf-8")
+
+
+def get_import_mode(dolt: Dolt, table: str, import_mode: Optional[str] = None) -> str:
+    """
+    `import_mode` checked against whether `table` exists, defaulting to
+    update for an existing table and create otherwise. doltcli's
+    `_get_import_mode_and_flags` replaces an explicit mode with that default.
+
+    :param dolt:
+    :param table:
+    :param import_mode:
+    :return:
+    """
+    if import_mode is not None and import_mode not in IMPORT_MODES_TO_FLAGS:
+        raise ValueError(f"import_mode must be one of: {list(IMPORT_MODES_TO_FLAGS)}")
+
+    # through SQL, so a BranchSession sees its own branch
+    exists = bool(
+        read_table_sql(
+            dolt,
+            f"""
+            select
+                table_name
+            from
+                information_schema.tables
+            where
+                table_schema = database()
+                and table_name = '{table}'
+        """,
+        )
+    )
+    if import_mode is None:
+        return UPDATE if exists else CREATE
+    if import_mode == CREATE and exists:
+        raise ValueError(f"Table {table} exists, use import_mode='{FORCE_CREATE}'")
+    if import_mode in (UPDATE, REPLACE) and not exists:
+        raise ValueError(f"Table {table} does not exist, use import_mode='{CREATE}'")
+    return import_mode
+
+
+def insert_pandas(
+    dolt: Dolt,
+    table: str,
+    df: "pd.DataFrame",
+    import_mode: Optional[str] = None,
+    primary_key: Optional[List[str]] = None,
+    commit: Optional[bool] = False,
+    commit_message: Optional[str] = None,
+    commit_date: Optional[datetime.datetime] = None,
+    type_overrides: Optional[Dict[str, str]] = None,
+    batch_size: int = INSERT_BATCH_SIZE,
+):
+    """
+    Write `df` with batched `INSERT` statements in one SQL session, following
+    the `dolt table import` mode semantics. Avoids the temporary CSV and
+    import process, which dominate the cost of small writes.
+
+    :param dolt:
+    :param table:
+    :param df:
+    :param import_mode:
+    :param primary_key: required when the table is created
+    :param commit:
+    :param commit_message:
+    :param commit_date:
+    :param type_overrides: column name -> Dolt type, used on table creation
+    :param batch_size: rows per `INSERT` statement
+    :return:
+    """
+    import_mode = get_import_mode(dolt, table, import_mode)
+
+    statements = []
+    if import_mode in (CREATE, FORCE_CREATE):
+        if not primary_key:
+            raise ValueError(f"Creating table {table} requires a primary key")
+        if import_mode == FORCE_CREATE:
+            statements.append(f"DROP TABLE IF EXISTS `{table}`;")
+        statements.append(get_create_table_sql(table, df, primary_key, type_overrides))
+    elif import_mode == REPLACE:
+        statements.append(f"DELETE FROM `{table}`;")
+
+    statements.extend(get_insert_sql(table, df, batch_size=batch_size))
+    execute_sql_script(dolt, "\n".join(statements))
+
+    if commit:
+        msg = (
+            commit_message or f"Committing write to table {table} in {import_mode} mode"
+        )
+        dolt.add(table)
+        dolt.commit(msg, date=commit_date)
+
+
+FINGERPRINT_TABLE = "dolt_integrations_fingerprints"
+
+
+def pandas_fingerprint(df: "pd.DataFrame") -> str:
+    """
+    Content hash of a DataFrame, covering column names, dtypes, index and
+    values.
+    """
+    import pandas as pd
+
+    h = hashlib.sha256()
+    h.update(json.dumps([[str(c), str(t)] for c, t in df.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return h.hexdigest()
+
+
+def get_fingerprint(dolt: Dolt, table: str) -> Optional[str]:
+    """
+    Fingerprint recorded by the last `set_fingerprint` for `table`, provided
+    the table's Dolt hash shows it has not been modified since.
+    """
+    try:
+        res = dolt.sql(
+            f"""
+            select
+                fingerprint
+            from
+                `{FINGERPRINT_TABLE}`
+            where
+                table_name = '{table}'
+                and table_hash = dolt_hashof_table('{table}')
+        """,
+            result_format="csv",
+        )
+    except DoltException:
+        # no fingerprints recorded yet, or the table does not exist
+        return None
+    return res[0]["fingerprint"] if len(res) > 0 else None
+
+
+def set_fingerprint(dolt: Dolt, table: str, fingerprint: str):
+    """
+    Record `fingerprint` as the content of `table`'s working set, for the
+    caller to commit alongside the table.
+    """
+    execute_sql_script(
+        dolt,
+        f"""
+        CREATE TABLE IF NOT EXISTS `{FINGERPRINT_TABLE}` (
+            table_name varchar(255) NOT NULL,
+            fingerprint varchar(64),
+            table_hash varchar(64),
+            PRIMARY KEY (table_name)
+        );
+        REPLACE INTO `{FINGERPRINT_TABLE}`
+        VALUES ('{table}', '{fingerprint}', dolt_hashof_table('{table}'));
+    """,
+    )
 
 
 def write_pandas(
     dolt: Dolt,
     table: str,
-    df: pd.DataFrame,
+    df: "pd.DataFrame",
     import_mode: Optional[str] = None,
     primary_key: Optional[List[str]] = None,
     commit: Optional[bool] = False,
     commit_message: Optional[str] = None,
     commit_date: Optional[datetime.datetime] = None,
+    type_overrides: Optional[Dict[str, str]] = None,
+    max_insert_rows: int = BULK_INSERT_MAX_ROWS,
 ):
     """
+    When the write creates the table, its schema is derived from the
+    DataFrame dtypes (see `get_create_table_sql`) rather than inferred by
+    Dolt from the CSV, so column types are stable across runs.
+
+    Frames of up to `max_insert_rows` rows are written with `insert_pandas`;
+    larger ones go through `dolt table import`.
 
     :param dolt:
     :param table:
@@ -41,17 +852,58 @@ def write_pandas(
     :param commit:
     :param commit_message:
     :param commit_date:
+    :param type_overrides: column name -> Dolt type, used on table creation
+    :param max_insert_rows: largest frame written with `INSERT` statements
     :return:
     """
+    import_mode = get_import_mode(dolt, table, import_mode)
+
+    # only pay for a copy when there are rows to drop
+    keys = df if primary_key is None else df[primary_key]
+    if keys.isna().values.any():
+        df = df.dropna(subset=primary_key)
+
+    creates = import_mode in (CREATE, FORCE_CREATE)
+    if len(df) <= max_insert_rows and (primary_key or not creates):
+        insert_pandas(
+            dolt=dolt,
+            table=table,
+            df=df,
+            import_mode=import_mode,
+            primary_key=primary_key,
+            commit=commit,
+            commit_message=commit_message,
+            commit_date=commit_date,
+            type_overrides=type_overrides,
+        )
+        return
+
+    if creates and primary_key:
+        bools = [col for col in df.columns if df[col].dtype.kind == "b"]
+        schema = get_create_table_sql(table, df, primary_key, type_overrides)
+        if bools:
+            df = df.astype({col: "Int8" for col in bools})
+
+        _import_with_schema(
+            dolt=dolt,
+            table=table,
+            write_import_file=lambda filepath: df.to_csv(filepath, index=False),
+            schema=schema,
+            import_mode=import_mode,
+            commit=commit,
+            commit_message=commit_message,
+            commit_date=commit_date,
+        )
+        return
 
     def writer(filepath: str):
-        clean = df.dropna(subset=primary_key)
-        clean.to_csv(filepath, index=False)
+        df.to_csv(filepath, index=False)
 
-    _import_helper(
+    _import_with_schema(
         dolt=dolt,
         table=table,
         write_import_file=writer,
+        schema=None,
         primary_key=primary_key,
         import_mode=import_mode,
         commit=commit,
@@ -1,4 +1,7 @@
 import csv
+import os
+import threading
+import time
 
 import pytest
 
@@ -203,3 +206,180 @@ def test_save(doltdb, tmpfile):
     res = doltdb.sql("select * from bar", result_format="csv")
     for r1, r2 in zip(cmp, res):
         assert r1["c"] == int(r2["c"])
+
+
+def test_load_skips_unchanged(doltdb, tmpfile):
+    kwargs = dict(
+        db=doltdb,
+        tablename="foo",
+        filename=tmpfile,
+        meta_conf=CallbackMeta(fn=lambda x: x["to_commit"]),
+        branch_conf=SerialBranch("new"),
+    )
+    res = load(**kwargs)
+    assert read_manifest(tmpfile)["commit"] == res
+    mtime = os.stat(tmpfile).st_mtime_ns
+
+    assert load(**kwargs) == res
+    assert os.stat(tmpfile).st_mtime_ns == mtime
+
+    load(force=True, **kwargs)
+    assert os.stat(tmpfile).st_mtime_ns != mtime
+
+
+def test_load_unchanged_records_meta(doltdb, tmpfile):
+    kwargs = dict(
+        db=doltdb,
+        tablename="foo",
+        filename=tmpfile,
+        meta_conf=DoltMeta(db=doltdb, tablename="meta"),
+    )
+    first = load(**kwargs)
+    time.sleep(1)  # meta rows are keyed by a timestamp with second precision
+    second = load(**kwargs)
+
+    assert second["to_commit"] == first["to_commit"]
+    meta_res = doltdb.sql("select * from meta", result_format="csv")
+    assert len(meta_res) == 2
+
+
+def test_load_reexports_on_new_commit(doltdb, tmpfile):
+    kwargs = dict(db=doltdb, tablename="foo", filename=tmpfile)
+    load(**kwargs)
+    doltdb.sql("insert into foo values (10,10)")
+    doltdb.sql("call dolt_commit('-am', 'Add row')")
+    load(**kwargs)
+    assert len(read_csv_to_dict(tmpfile)) == 6
+
+
+def test_save_skips_unchanged(doltdb, tmpfile):
+    write_dict_to_csv([dict(c=0, d=0), dict(c=1, d=1)], tmpfile)
+    kwargs = dict(db=doltdb, tablename="bar", filename=tmpfile, save_args=dict(primary_key="c"))
+
+    meta_conf = CallbackMeta(fn=lambda x: x)
+    first = save(meta_conf=meta_conf, **kwargs)
+    assert first["from_commit"] != first["to_commit"]
+
+    second = save(meta_conf=meta_conf, **kwargs)
+    assert second["from_commit"] == second["to_commit"] == first["to_commit"]
+
+    doltdb.sql("insert into bar values (5, 5)")
+    doltdb.sql("call dolt_commit('-am', 'Edit bar')")
+    third = save(meta_conf=meta_conf, **kwargs)
+    assert third["from_commit"] != third["to_commit"]
+
+    kwargs["save_args"] = dict(primary_key=["c", "d"])
+    fourth = save(meta_conf=meta_conf, **kwargs)
+    assert fourth["from_commit"] != fourth["to_commit"]
+
+
+def test_save_fingerprint(tmpfile):
+    write_dict_to_csv([dict(c=0, d=0)], tmpfile)
+    fingerprint = save_fingerprint(tmpfile, dict(primary_key="c"))
+    assert fingerprint == save_fingerprint(tmpfile, dict(primary_key="c"))
+    assert fingerprint != save_fingerprint(tmpfile, dict(primary_key="d"))
+    assert fingerprint != save_fingerprint(tmpfile)
+
+
+def test_branch_session(doltdb):
+    branch_conf = SerialBranch("new", session=True)
+    with branch_conf(doltdb) as db:
+        assert db.active_branch == "new"
+        assert doltdb.active_branch == "master"
+        res = db.sql("select count(*) as c from foo", result_format="csv")
+        assert res[0]["c"] == "9"
+
+
+def test_save_load_session(doltdb, tmpfile):
+    write_dict_to_csv([dict(c=0, d=0), dict(c=1, d=1)], tmpfile)
+    master_head = doltdb.head
+
+    meta = save(
+        db=doltdb,
+        tablename="bar",
+        filename=tmpfile,
+        save_args=dict(primary_key="c"),
+        meta_conf=CallbackMeta(fn=lambda x: x),
+        branch_conf=NewBranch("session_branch", session=True),
+    )
+    assert meta["branch"] == "session_branch"
+    assert doltdb.active_branch == "master"
+    assert doltdb.head == master_head
+
+    outfile = tmpfile + ".out"
+    load(
+        db=doltdb,
+        tablename="bar",
+        filename=outfile,
+        branch_conf=SerialBranch("session_branch", session=True),
+    )
+    assert read_csv_to_dict(outfile) == [dict(c="0", d="0"), dict(c="1", d="1")]
+
+
+def test_save_session_replaces_rows(doltdb, tmpfile):
+    kwargs = dict(
+        db=doltdb,
+        tablename="bar",
+        filename=tmpfile,
+        save_args=dict(primary_key="c"),
+        branch_conf=NewBranch("session_branch", session=True),
+    )
+    write_dict_to_csv([dict(c=0, d=0), dict(c=1, d=1)], tmpfile)
+    save(**kwargs)
+    write_dict_to_csv([dict(c=1, d=2)], tmpfile)
+    save(**kwargs)
+
+    session = BranchSession(doltdb.repo_dir, "session_branch")
+    res = session.sql("select * from bar", result_format="csv")
+    assert res == [dict(c="1", d="2")]
+
+
+def test_save_session_locks_branch(doltdb, tmpfile):
+    write_dict_to_csv([dict(c=0, d=0)], tmpfile)
+    saved = threading.Event()
+
+    def run():
+        save(
+            db=doltdb,
+            tablename="bar",
+            filename=tmpfile,
+            save_args=dict(primary_key="c"),
+            branch_conf=NewBranch("session_branch", session=True),
+        )
+        saved.set()
+
+    with branch_lock(doltdb.repo_dir, "session_branch").exclusive():
+        t = threading.Thread(target=run)
+        t.start()
+        assert not saved.wait(0.5)
+    t.join()
+    assert saved.is_set()
+
+
+def test_branch_session_repo_name(doltdb):
+    name = os.path.basename(os.path.realpath(doltdb.repo_dir)).replace("-", "_")
+    cwd = os.getcwd()
+    os.chdir(doltdb.repo_dir)
+    try:
+        session = BranchSession(".", "master")
+        assert session.use_statement == f"USE `{name}/master`;"
+    finally:
+        os.chdir(cwd)
+
+
+def test_session_tracks_state(doltdb):
+    session = DoltSession.of(doltdb)
+    assert DoltSession.of(session) is session
+    assert session.active_branch == "master"
+
+    session.sql("insert into foo values (10,10)", result_format="csv")
+    session.sql("call dolt_add('.')", result_format="csv")
+    head = session.sql_commit("Add row")
+    assert session.head == head == doltdb.head
+    assert session.branches["master"] == head
+
+    session.sql_checkout("tracked", create=True)
+    assert session.active_branch == "tracked"
+    assert session.head == head
+    session.revalidate()
+    assert session.active_branch == "tracked"
@@ -0,0 +1,17 @@
+import doltcli as dolt
+import pandas as pd
+import pytest
+
+from dolt_integrations.utils import write_pandas
+
+
+@pytest.fixture(scope="function")
+def doltdb(tmpdir):
+    db = dolt.Dolt.init(str(tmpdir.mkdir("labels")))
+    labels = pd.DataFrame({"id": [1, 2], "label": [0, 1]})
+    write_pandas(db, "labels", labels, import_mode="create", primary_key=["id"])
+    other = pd.DataFrame({"id": [1]})
+    write_pandas(db, "other", other, import_mode="create", primary_key=["id"])
+    db.add(["labels", "other"])
+    db.commit("Add labels")
+    return db
@@ -0,0 +1,45 @@
+import json
+
+from dolt_integrations.dvc import fingerprint, query_hash, table_hash, write_fingerprint
+
+
+def test_table_hash_ignores_unrelated_commits(doltdb):
+    before = table_hash(doltdb, "labels")
+    commit = doltdb.head
+
+    doltdb.sql("insert into other values (2)")
+    doltdb.add("other")
+    doltdb.commit("Edit other")
+    assert table_hash(doltdb, "labels") == before
+
+    doltdb.sql("update labels set label = 2 where id = 1")
+    assert table_hash(doltdb, "labels") == before
+    doltdb.add("labels")
+    doltdb.commit("Edit labels")
+    assert table_hash(doltdb, "labels") != before
+    assert table_hash(doltdb, "labels", commit=commit) == before
+
+
+def test_query_hash(doltdb):
+    query = "select * from labels where label = 1"
+    pinned = query_hash(doltdb, query, tables=["labels"])
+    by_commit = query_hash(doltdb, query)
+
+    doltdb.sql("insert into other values (2)")
+    doltdb.add("other")
+    doltdb.commit("Edit other")
+    assert query_hash(doltdb, query, tables=["labels"]) == pinned
+    assert query_hash(doltdb, query) != by_commit
+
+
+def test_write_fingerprint(doltdb, tmpdir):
+    path = str(tmpdir.join("labels.dolt.json"))
+    assert write_fingerprint(path, doltdb, tables=["labels"], queries={"q": "select 1"})
+    assert not write_fingerprint(
+        path, doltdb, tables=["labels"], queries={"q": "select 1"}
+    )
+
+    with open(path) as f:
+        data = json.load(f)
+    assert data == fingerprint(doltdb, tables=["labels"], queries={"q": "select 1"})
+    assert set(data["tables"]) == {"labels"}
@@ -69,7 +69,7 @@ def doltdb():
             table="bar",
             df=df_v2.reset_index(),
             primary_key=["index"],
-            import_mode="create",
+            import_mode="replace",
         )
         db.add("bar")
         db.commit("Edit bar")
@@ -97,6 +97,26 @@ def inactive_run():
     yield Run()
 
 
+@pytest.fixture(scope="function")
+def otherdb(doltdb):
+    db_path = os.path.join(os.path.dirname(doltdb), "foo-beds")
+    try:
+        db = Dolt.init(db_path)
+        write_pandas(
+            dolt=db,
+            table="beds",
+            df=pd.DataFrame({"A": [1, 2], "C": [10, 20]}),
+            primary_key=["A"],
+            import_mode="create",
+        )
+        db.add("beds")
+        db.commit("Initialize beds")
+        yield db_path
+    finally:
+        if os.path.exists(db_path):
+            shutil.rmtree(db_path)
+
+
 @pytest.fixture(scope="function")
 def active_run(active_current):
     print(active_current.is_running_flow)
@@ -1,10 +1,35 @@
+import copy
+import time
+
 from doltcli import Dolt
 import numpy as np
 import pandas as pd
 import pytest
 
-from dolt_integrations.metaflow import DoltDT, detach_head
-from dolt_integrations.utils import read_pandas_sql
+from dolt_integrations.metaflow import (
+    DoltConfig,
+    DoltDT,
+    detach_head,
+    dolt_step,
+    prune_detached_branches,
+)
+from dolt_integrations.metaflow.dolt import (
+    BYTES,
+    DoltDTBase,
+    dump_audit,
+    encode_audit,
+    load_audit,
+)
+from dolt_integrations.utils import (
+    DtypePolicy,
+    ReadBudgetExceeded,
+    read_pandas_sql,
+    wait_for_commits,
+    write_pandas,
+)
+from dolt_integrations.utils.commits import enqueue_commit, pending_commits
+from dolt_integrations.utils.lock import lock_metrics
+from dolt_integrations.utils.utils import SQL_ARG_MAX_BYTES
 
 
 def test_branchdt_cm_init(active_run, dolt_config):
@@ -178,3 +203,401 @@ def test_detach_head(doltdb):
 
     assert sum1["sum"] == "3"
     assert sum2["sum"] == "6"
+
+
+def branch_names(db):
+    return sorted(b.name for b in db.branch()[1])
+
+
+def test_detach_head_cleans_up(doltdb):
+    db = Dolt(doltdb)
+    commits = list(db.log().keys())
+
+    with detach_head(db, commits[1]):
+        assert db.head == commits[1]
+        assert f"detached_HEAD_at_{commits[1]}" in branch_names(db)
+    assert branch_names(db) == ["master"]
+
+    # a leftover temporary branch at the commit is reused, then removed
+    db.branch("detached_HEAD_at_old", start_point=commits[1])
+    with detach_head(db, commits[1]):
+        assert branch_names(db) == ["detached_HEAD_at_old", "master"]
+    assert branch_names(db) == ["master"]
+
+
+def test_prune_detached_branches(doltdb):
+    db = Dolt(doltdb)
+    commits = list(db.log().keys())
+    for i in range(5):
+        db.branch(f"detached_HEAD_at_{i}", start_point=commits[1])
+    db.branch("keep", start_point=commits[1])
+
+    pruned = prune_detached_branches(db, batch_size=2)
+    assert len(pruned) == 5
+    assert branch_names(db) == ["keep", "master"]
+
+
+def test_auditdt_replay_all(active_run, dolt_audit1, doltdb):
+    db = Dolt(doltdb)
+    logs = list(db.log(2).keys())
+    old = dict(dolt_audit1["actions"]["bar"], key="bar_v1", commit=logs[1])
+    dolt_audit1["actions"]["bar_v1"] = old
+
+    with DoltDT(run=active_run, audit=dolt_audit1) as dolt:
+        tables = dolt.replay_all()
+
+    np.testing.assert_array_equal(tables["bar"].A.values, [2, 2, 2])
+    np.testing.assert_array_equal(tables["bar_v1"].A.values, [1, 1, 1])
+    assert set(active_run.dolt["actions"]) == {"bar", "bar_v1"}
+
+
+def test_auditdt_prefetch_read(active_run, dolt_audit1):
+    with DoltDT(run=active_run, audit=dolt_audit1) as dolt:
+        dolt.prefetch()
+        assert "bar" in dolt._prefetched
+        df = dolt.read("bar", as_key="bar2")
+    np.testing.assert_array_equal(df.A.values, [2, 2, 2])
+    assert "bar2" in active_run.dolt["actions"]
+
+
+def make_audit(n):
+    config = {
+        "id": "dd9f1f38-6802-4657-b869-602dde993180",
+        "database": "foo",
+        "branch": "master",
+        "commit": "abc",
+        "dolthub_remote": False,
+        "push_on_commit": False,
+    }
+    actions = {
+        f"bar{i}": {
+            "key": f"bar{i}",
+            "config_id": config["id"],
+            "pathspec": "VersioningDemo/1611853111934656/start/1",
+            "table_name": "bar",
+            "kind": "read",
+            "query": "SELECT * FROM `bar`",
+            "commit": "abc",
+            "from_commit": None,
+            "artifact_name": None,
+            "aggregate": None,
+            "lookup": None,
+            "databases": None,
+            "commit_token": None,
+            "timestamp": 1611853112.794624 + i,
+        }
+        for i in range(n)
+    }
+    return {"actions": actions, "configs": {config["id"]: config}}
+
+
+def test_audit_encoding_roundtrip():
+    audit = make_audit(1000)
+    compact = encode_audit(audit)
+    assert compact["strings"].count("SELECT * FROM `bar`") == 1
+    assert load_audit(compact) == audit
+    assert load_audit(dump_audit(audit)) == audit
+    assert load_audit(audit) is audit
+    assert len(dump_audit(audit)) < len(repr(audit)) / 10
+
+
+def test_compact_artifact(active_run, dolt_audit1):
+    active_run.dolt = encode_audit(dolt_audit1)
+    with DoltDT(run=active_run, audit=active_run.dolt, artifact_format="bytes") as dolt:
+        df = dolt.read("bar", as_key="bar2")
+    np.testing.assert_array_equal(df.A.values, [2, 2, 2])
+    assert isinstance(active_run.dolt, bytes)
+    assert set(load_audit(active_run.dolt)["actions"]) == {"bar", "bar2"}
+
+
+def test_branchdt_read_changes(active_run, dolt_config, doltdb):
+    db = Dolt(doltdb)
+    logs = list(db.log(2).keys())
+
+    with DoltDT(run=active_run, config=dolt_config) as dolt:
+        exclusive = lock_metrics(doltdb).exclusive_acquired
+        changes = dolt.read_changes("bar", since=logs[1])
+        assert lock_metrics(doltdb).exclusive_acquired == exclusive
+
+    assert list(changes.columns) == ["diff_type", "index", "A", "B"]
+    assert set(changes.diff_type) == {"modified"}
+    np.testing.assert_array_equal(changes.A.values, [2, 2, 2])
+
+    action = active_run.dolt["actions"]["bar"]
+    assert action["from_commit"] == logs[1]
+    assert action["commit"] == logs[0]
+
+
+def test_branchdt_read_changes_since_run(active_run, dolt_config, dolt_audit1, doltdb):
+    db = Dolt(doltdb)
+    logs = list(db.log(2).keys())
+    dolt_audit1["actions"]["bar"]["commit"] = logs[1]
+    dolt_audit1["configs"][dolt_audit1["actions"]["bar"]["config_id"]][
+        "database"
+    ] = doltdb
+
+    class PreviousRun:
+        class data:
+            dolt = dolt_audit1
+
+    dolt = DoltDT(config=dolt_config)
+    changes = dolt.read_changes("bar", since=PreviousRun())
+    assert len(changes) == 3
+
+
+def test_branchdt_write_unchanged(active_run, dolt_config, doltdb):
+    input_df = pd.DataFrame({"A": [2, 2, 2], "B": [2, 2, 2]})
+    with DoltDT(run=active_run, config=dolt_config) as dolt:
+        dolt.write(df=input_df, table_name="baz")
+    head = Dolt(doltdb).head
+
+    with DoltDT(run=active_run, config=DoltConfig(database=doltdb)) as dolt:
+        dolt.write(df=input_df, table_name="baz", as_key="baz2")
+
+    assert Dolt(doltdb).head == head
+    assert active_run.dolt["actions"]["baz2"]["commit"] == head
+
+
+def test_branchdt_lookup(active_run, dolt_config):
+    with DoltDT(run=active_run, config=dolt_config) as dolt:
+        df = dolt.lookup("bar", [2, 7, 0], columns=["A"], batch_size=1)
+
+    assert list(df.columns) == ["index", "A"]
+    assert list(df["index"]) == [2, 7, 0]
+    assert df.A.isna().tolist() == [False, True, False]
+
+    action = active_run.dolt["actions"]["bar"]
+    assert action["commit"] == dolt_config.commit
+    assert "IN (2, 7, 0)" in action["query"]
+
+    replayed = DoltDT(audit=active_run.dolt).read("bar")
+    pd.testing.assert_frame_equal(replayed, df)
+
+
+def test_branchdt_lookup_many_keys(active_run, dolt_config):
+    keys = list(range(30000, 0, -1))
+    with DoltDT(run=active_run, config=dolt_config) as dolt:
+        df = dolt.lookup("bar", keys)
+    assert len(active_run.dolt["actions"]["bar"]["query"]) > SQL_ARG_MAX_BYTES
+
+    replayed = DoltDT(audit=active_run.dolt).read("bar")
+    assert list(replayed["index"]) == keys
+    assert replayed.A.notna().sum() == 2
+    pd.testing.assert_frame_equal(replayed, df)
+
+
+def test_branchdt_aggregate(active_run, dolt_config):
+    with DoltDT(run=active_run, config=dolt_config) as dolt:
+        df = dolt.aggregate(
+            "bar", group_by=["A"], aggs={"total": ("B", "sum"), "n": ("B", "count")}
+        )
+        median = dolt.aggregate(
+            "bar",
+            group_by=["A"],
+            aggs={"median": ("B", "median")},
+            where="`index` > 0",
+            as_key="bar_median",
+        )
+
+    assert df.to_dict("records") == [{"A": 2, "total": 6, "n": 3}]
+    assert median.to_dict("records") == [{"A": 2, "median": 2}]
+
+    actions = active_run.dolt["actions"]
+    assert "GROUP BY `A`" in actions["bar"]["query"]
+    assert actions["bar"]["aggregate"] is None
+    assert actions["bar_median"]["aggregate"]["group_by"] == ["A"]
+
+    replayed = DoltDT(audit=active_run.dolt).read("bar_median")
+    pd.testing.assert_frame_equal(replayed, median)
+
+
+def test_branchdt_read_dtypes(active_run, dolt_config):
+    with DoltDT(run=active_run, config=dolt_config) as dolt:
+        df = dolt.read("bar", dtypes=DtypePolicy(nullable_ints=False))
+    assert df.dtypes.astype(str).to_dict() == {
+        "index": "int8",
+        "A": "int8",
+        "B": "int8",
+    }
+    assert df.attrs["memory_saved"] > 0
+    assert active_run.dolt["actions"]["bar"]["query"] == "SELECT * FROM `bar`"
+
+
+def test_dolt_module_not_shadowed():
+    import importlib
+
+    import dolt_integrations.metaflow as package
+
+    module = importlib.import_module("dolt_integrations.metaflow.dolt")
+    assert package.dolt is module
+    assert module.DoltDT is DoltDT
+
+
+def test_dolt_step_decorator(active_run, dolt_config):
+    @dolt_step(
+        reads={"bar": "bar", "twos": "SELECT * FROM bar WHERE A = 2"},
+        config=lambda flow: dolt_config,
+    )
+    def start(self):
+        self.total = int(self.dolt_inputs.twos.B.sum())
+        return self.dolt_inputs["bar"]
+
+    df = start(active_run)
+    np.testing.assert_array_equal(df.A.values, [2, 2, 2])
+    assert active_run.total == 6
+    assert not hasattr(active_run, "dolt_inputs")
+
+    actions = active_run.dolt["actions"]
+    assert actions["bar"]["query"] == "SELECT * FROM `bar`"
+    assert actions["twos"]["query"] == "SELECT * FROM bar WHERE A = 2"
+    assert actions["bar"]["commit"] == dolt_config.commit
+
+    @dolt_step(reads={"twos": "ignored in audit mode"}, audit=active_run.dolt)
+    def replay(self):
+        return self.dolt_inputs.twos
+
+    np.testing.assert_array_equal(replay(active_run).A.values, [2, 2, 2])
+
+
+def test_branchdt_deferred_commit(active_run, doltdb):
+    config = DoltConfig(database=doltdb, deferred_commit=True)
+    with DoltDT(run=active_run, config=config) as dolt:
+        dolt.write(df=pd.DataFrame({"A": [3], "B": [3]}), table_name="baz")
+
+    wait_for_commits(doltdb)
+    db = Dolt(doltdb)
+    assert db.status().is_clean
+    assert pending_commits(doltdb) == []
+    assert active_run.dolt["actions"]["baz"]["commit"] == db.head
+
+    audit = copy.deepcopy(active_run.dolt)
+    audit["actions"]["baz"]["commit"] = None
+    df = DoltDT(audit=audit).read("baz")
+    np.testing.assert_array_equal(df.A.values, [3])
+
+
+def test_deferred_commits_resolved_by_token(active_run, doltdb):
+    config = DoltConfig(database=doltdb, deferred_commit=True)
+    for key, values in [("first", [3]), ("second", [4])]:
+        with DoltDT(run=active_run, config=config) as dolt:
+            df = pd.DataFrame({"A": values, "B": values})
+            dolt.write(df=df, table_name="baz", pks=["A"], as_key=key)
+        wait_for_commits(doltdb)
+
+    audit = copy.deepcopy(active_run.dolt)
+    assert audit["actions"]["first"]["commit_token"] is not None
+    audit["actions"]["first"]["commit"] = None
+    df = DoltDT(audit=audit).read("first")
+    np.testing.assert_array_equal(df.A.values, [3])
+
+
+def test_consecutive_contexts_keep_actions(active_run, doltdb, otherdb, monkeypatch):
+    commit_actions = DoltDTBase._commit_actions
+
+    def slow_commit_actions(self, *args, **kwargs):
+        time.sleep(0.5)  # let the second context store first
+        return commit_actions(self, *args, **kwargs)
+
+    monkeypatch.setattr(DoltDTBase, "_commit_actions", slow_commit_actions)
+    config = DoltConfig(database=doltdb, deferred_commit=True)
+    with DoltDT(run=active_run, config=config, artifact_format=BYTES) as dolt:
+        dolt.write(df=pd.DataFrame({"A": [3], "B": [3]}), table_name="baz")
+    config = DoltConfig(database=otherdb)
+    with DoltDT(run=active_run, config=config, artifact_format=BYTES) as dolt:
+        dolt.read("beds")
+
+    wait_for_commits(doltdb)
+    audit = load_audit(active_run.dolt)
+    assert set(audit["actions"]) == {"baz", "beds"}
+    assert audit["actions"]["baz"]["commit"] == Dolt(doltdb).head
+
+
+def test_orphaned_commit_drained(active_run, doltdb):
+    db = Dolt(doltdb)
+    write_pandas(db, "baz", pd.DataFrame({"A": [3]}), primary_key=["A"])
+    enqueue_commit(doltdb, "Run: Flow/1/start/1", ["baz"])
+
+    DoltDT(config=DoltConfig(database=doltdb))
+    assert db.status().is_clean
+    assert pending_commits(doltdb) == []
+    assert list(db.log(1).values())[0].message == "Run: Flow/1/start/1"
+
+
+def test_branchdt_read_over_budget(active_run, doltdb):
+    config = DoltConfig(database=doltdb, memory_budget=40)
+    with DoltDT(run=active_run, config=config) as dolt:
+        with pytest.raises(ReadBudgetExceeded):
+            dolt.read("bar")
+    assert "bar" not in active_run.dolt["actions"]
+
+
+def test_branchdt_stream_over_budget(active_run, doltdb):
+    config = DoltConfig(database=doltdb, memory_budget=40, stream_over_budget=True)
+    with DoltDT(run=active_run, config=config) as dolt:
+        chunks = list(dolt.read("bar"))
+
+    assert [len(c) for c in chunks] == [1, 1, 1]
+    np.testing.assert_array_equal(pd.concat(chunks).A.values, [2, 2, 2])
+    assert active_run.dolt["actions"]["bar"]["query"] == "SELECT * FROM `bar`"
+
+    replayed = DoltDT(audit=active_run.dolt).read("bar")
+    assert [len(c) for c in replayed] == [1, 1, 1]
+
+
+def test_branchdt_budget_only_streams_tables(active_run, doltdb):
+    config = DoltConfig(database=doltdb, memory_budget=40, stream_over_budget=True)
+    with DoltDT(run=active_run, config=config) as dolt:
+        df = dolt.sql("SELECT * FROM `bar`", as_key="bar_query")
+
+    assert isinstance(df, pd.DataFrame)
+    replayed = DoltDT(audit=active_run.dolt).sql("SELECT * FROM `bar`", "bar_query")
+    assert isinstance(replayed, pd.DataFrame)
+    assert len(replayed) == len(df) == 3
+
+
+def test_branchdt_query_databases(active_run, doltdb, otherdb):
+    databases = dict(foo=DoltConfig(database=doltdb), beds=DoltConfig(database=otherdb))
+    with DoltDT(run=active_run, databases=databases) as dolt:
+        df = dolt.query(
+            "SELECT b.A, b.B, c.C FROM {foo}.bar b JOIN {beds}.beds c ON b.A = c.A",
+            as_key="joined",
+        )
+    np.testing.assert_array_equal(df.C.values, [20, 20, 20])
+
+    action = active_run.dolt["actions"]["joined"]
+    assert action["databases"] == {name: c.id for name, c in databases.items()}
+    beds_config = active_run.dolt["configs"][databases["beds"].id]
+    assert beds_config["commit"] == Dolt(otherdb).head
+
+    # later commits do not change the replay
+    db = Dolt(otherdb)
+    write_pandas(db, "beds", pd.DataFrame({"A": [2], "C": [30]}), primary_key=["A"])
+    db.add("beds")
+    db.commit("Edit beds")
+    replayed = DoltDT(audit=active_run.dolt).read("joined")
+    pd.testing.assert_frame_equal(replayed, df)
+
+
+def test_branchdt_query_databases_braces(active_run, doltdb, otherdb):
+    databases = dict(foo=DoltConfig(database=doltdb), beds=DoltConfig(database=otherdb))
+    with DoltDT(run=active_run, databases=databases) as dolt:
+        df = dolt.query(
+            "SELECT b.A FROM {foo}.bar b WHERE b.A REGEXP '^[0-9]{1}$'",
+            as_key="braces",
+        )
+        with pytest.raises(ValueError):
+            dolt.query("SELECT * FROM {missing}.bar", as_key="missing")
+    np.testing.assert_array_equal(df.A.values, [2, 2, 2])
+
+    replayed = DoltDT(audit=active_run.dolt).read("braces")
+    pd.testing.assert_frame_equal(replayed, df)
+
+
+def test_branchdt_query_databases_apart(active_run, doltdb, tmpdir):
+    other = Dolt.init(str(tmpdir))
+    databases = dict(
+        foo=DoltConfig(database=doltdb), other=DoltConfig(database=other.repo_dir)
+    )
+    with DoltDT(run=active_run, databases=databases) as dolt:
+        with pytest.raises(ValueError):
+            dolt.query("SELECT * FROM {foo}.bar", as_key="bar")
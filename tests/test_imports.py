@@ -0,0 +1,41 @@
+import re
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = {"pandas", "metaflow", "dataclasses_json"}
+
+# cumulative microseconds; generous so slow CI hosts don't flake, but an
+# eager pandas/metaflow import (~0.3-0.5s) still trips it
+IMPORT_BUDGET_US = 250000
+
+
+def importtime(module: str):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)", line)
+        if m:
+            cumulative[m.group(2)] = int(m.group(1))
+    return cumulative
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "dolt_integrations.core",
+        "dolt_integrations.dvc",
+        "dolt_integrations.metaflow",
+        "dolt_integrations.utils",
+    ],
+)
+def test_import_is_lazy(module):
+    imported = importtime(module)
+    assert not HEAVY_MODULES & set(imported)
+    assert imported[module] < IMPORT_BUDGET_US
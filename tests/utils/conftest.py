@@ -0,0 +1,7 @@
+import doltcli as dolt
+import pytest
+
+
+@pytest.fixture(scope="function")
+def doltdb(tmpdir):
+    return dolt.Dolt.init(tmpdir)
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dolt_integrations.utils import DoltDataset, write_pandas
+
+
+@pytest.fixture
+def dataset_db(doltdb):
+    df = pd.DataFrame({"id": np.arange(1000), "x": np.arange(1000) * 0.5})
+    write_pandas(doltdb, "samples", df, primary_key=["id"])
+    doltdb.add("samples")
+    doltdb.commit("Add samples")
+    return doltdb
+
+
+def test_dataset_batches(dataset_db):
+    dataset = DoltDataset(dataset_db, "samples", batch_size=64, block_rows=100)
+    batches = list(dataset)
+
+    assert [len(b["id"]) for b in batches] == [64] * 15 + [40]
+    ids = np.concatenate([b["id"] for b in batches])
+    np.testing.assert_array_equal(ids, np.arange(1000))
+    assert all(b["x"].flags["C_CONTIGUOUS"] for b in batches)
+    assert len(dataset.bounds) == 10
+
+
+def test_dataset_shuffled_shards(dataset_db):
+    shards = [
+        DoltDataset(
+            dataset_db,
+            "samples",
+            columns=["id"],
+            batch_size=50,
+            block_rows=100,
+            shuffle=True,
+            seed=0,
+            shard_index=i,
+            num_shards=2,
+            workers=2,
+        )
+        for i in range(2)
+    ]
+    ids = [np.concatenate([b["id"] for b in shard]) for shard in shards]
+
+    assert not set(ids[0]) & set(ids[1])
+    np.testing.assert_array_equal(np.sort(np.concatenate(ids)), np.arange(1000))
+    assert (ids[0] != np.sort(ids[0])).any()
+
+    first = np.concatenate([b["id"] for b in shards[0]])
+    np.testing.assert_array_equal(first, ids[0])
+    shards[0].set_epoch(1)
+    assert (np.concatenate([b["id"] for b in shards[0]]) != first).any()
+
+
+def test_dataset_pinned_commit(dataset_db):
+    dataset = DoltDataset(dataset_db, "samples", drop_last=True, batch_size=300)
+    dataset_db.sql("delete from samples where id >= 500")
+    assert [len(b["id"]) for b in dataset] == [300] * 3
@@ -0,0 +1,172 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import pytest
+
+from dolt_integrations.utils.lock import LockTimeout, RepoLock, branch_lock, repo_lock
+
+
+def hold(lock, mode, acquired, release):
+    with getattr(lock, mode)():
+        acquired.set()
+        release.wait()
+
+
+@pytest.fixture
+def held(tmpdir):
+    threads = []
+
+    def start(mode):
+        acquired, release = threading.Event(), threading.Event()
+        t = threading.Thread(
+            target=hold, args=(RepoLock(str(tmpdir)), mode, acquired, release)
+        )
+        t.start()
+        acquired.wait()
+        threads.append((t, release))
+
+    yield start
+    for t, release in threads:
+        release.set()
+        t.join()
+
+
+def test_shared_locks_coexist(tmpdir, held):
+    held("shared")
+    lock = RepoLock(str(tmpdir))
+    with lock.shared(timeout=0.1):
+        assert lock.held == "shared"
+    assert lock.held is None
+    assert lock.metrics.shared_acquired == 1
+
+
+def test_exclusive_excludes(tmpdir, held):
+    held("shared")
+    lock = RepoLock(str(tmpdir))
+    with pytest.raises(LockTimeout):
+        with lock.exclusive(timeout=0.05):
+            pass
+    assert lock.metrics.timeouts == 1
+
+
+def test_reentrant(tmpdir):
+    lock = RepoLock(str(tmpdir))
+    with lock.exclusive():
+        with lock.shared(timeout=0):
+            with lock.exclusive(timeout=0):
+                assert lock.held == "exclusive"
+    with lock.shared():
+        with pytest.raises(RuntimeError):
+            with lock.exclusive():
+                pass
+
+
+def test_repo_lock_registry(tmpdir):
+    assert repo_lock(str(tmpdir)) is repo_lock(str(tmpdir) + "/")
+
+
+def test_branch_locks(tmpdir):
+    acquired, release = threading.Event(), threading.Event()
+    lock = branch_lock(str(tmpdir), "feature/a")
+    t = threading.Thread(target=hold, args=(lock, "exclusive", acquired, release))
+    t.start()
+    acquired.wait()
+    try:
+        with branch_lock(str(tmpdir), "b").exclusive(timeout=0.1):
+            pass
+        with repo_lock(str(tmpdir)).exclusive(timeout=0.1):
+            pass
+        with pytest.raises(LockTimeout):
+            with RepoLock(str(tmpdir), scope="branch.feature/a").exclusive(0.05):
+                pass
+    finally:
+        release.set()
+        t.join()
+
+
+def test_waiting_writer_blocks_new_readers(tmpdir, held):
+    held("shared")
+
+    def write():
+        with pytest.raises(LockTimeout):
+            with RepoLock(str(tmpdir)).exclusive(timeout=0.5):
+                pass
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    time.sleep(0.1)  # let the writer queue up behind the reader
+    try:
+        with pytest.raises(LockTimeout):
+            with RepoLock(str(tmpdir)).shared(timeout=0.1):
+                pass
+    finally:
+        writer.join()
+
+
+def test_exclusive_lends_to_threads(tmpdir):
+    lock = RepoLock(str(tmpdir))
+
+    def read():
+        with lock.shared(timeout=0.1):
+            return lock.held
+
+    def write():
+        with pytest.raises(LockTimeout):
+            with lock.exclusive(timeout=0.05):
+                pass
+
+    with lock.exclusive():
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            lent_read = lock.lent(read)
+            assert list(pool.map(lambda _: lent_read(), range(2))) == ["shared"] * 2
+            pool.submit(write).result()
+    assert lock.metrics.shared_acquired == 0
+
+
+def test_exclusive_not_lent_unasked(tmpdir):
+    lock = RepoLock(str(tmpdir))
+
+    def read():
+        with pytest.raises(LockTimeout):
+            with lock.shared(timeout=0.05):
+                pass
+
+    with lock.exclusive():
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pool.submit(read).result()
+    assert lock.lent(read) is read
+
+
+def test_exclusive_waits_for_borrowers(tmpdir):
+    lock = RepoLock(str(tmpdir))
+    borrowed, release = threading.Event(), threading.Event()
+
+    def read(loan):
+        with lock.borrow(loan):
+            borrowed.set()
+            release.wait()
+
+    with lock.exclusive():
+        reader = threading.Thread(target=read, args=(lock.lend(),))
+        reader.start()
+        borrowed.wait()
+        threading.Timer(0.1, release.set).start()
+    assert release.is_set()
+    reader.join()
+
+
+def test_loan_ends_with_hold(tmpdir):
+    lock = RepoLock(str(tmpdir))
+    with lock.exclusive():
+        loan = lock.lend()
+    with pytest.raises(RuntimeError):
+        with lock.borrow(loan):
+            pass
+
+    with lock.exclusive():
+        loan = lock.lend()
+        lock.disown()
+        with pytest.raises(RuntimeError):
+            with lock.borrow(loan):
+                pass
@@ -0,0 +1,57 @@
+import datetime
+
+import pandas as pd
+
+from dolt_integrations.utils import MaintenancePolicy, enable_maintenance, write_pandas
+from dolt_integrations.utils.maintenance import (
+    maintain,
+    read_maintenance_state,
+    squash_history,
+    store_size,
+)
+
+
+def commit_rows(db, n):
+    for i in range(n):
+        write_pandas(db, "t", pd.DataFrame({"id": [i]}), primary_key=["id"])
+        db.add("t")
+        db.commit(f"Add {i}")
+
+
+def test_maintain_without_policy(doltdb):
+    assert maintain(doltdb) is None
+    assert read_maintenance_state(doltdb.repo_dir) is None
+
+
+def test_maintain_gc_every_commits(doltdb):
+    enable_maintenance(doltdb, MaintenancePolicy(gc_every_commits=2))
+    commit_rows(doltdb, 1)
+    assert maintain(doltdb) is None
+    assert read_maintenance_state(doltdb.repo_dir)["commits"] == 1
+
+    commit_rows(doltdb, 1)
+    metrics = maintain(doltdb)
+    assert metrics.commits == 2
+    assert metrics.size_before > 0
+    assert metrics.size_after == store_size(doltdb.repo_dir)
+
+    state = read_maintenance_state(doltdb.repo_dir)
+    assert state["commits"] == 0
+    assert state["size_at_gc"] == metrics.size_after
+
+
+def test_squash_history(doltdb):
+    commit_rows(doltdb, 3)
+    head = doltdb.head
+
+    squashed = squash_history(doltdb, datetime.datetime(9999, 1, 1), "compacted")
+    assert squashed == 3
+    assert doltdb.head == head
+    assert doltdb.active_branch == "master"
+
+    log = doltdb.sql(
+        "select count(*) as n from dolt_log as of 'compacted'", result_format="csv"
+    )
+    assert log[0]["n"] == "2"
+    rows = doltdb.sql("select * from t as of 'compacted'", result_format="csv")
+    assert len(rows) == 3
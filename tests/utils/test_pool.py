@@ -0,0 +1,74 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from dolt_integrations.utils import ClonePool, write_pandas
+from dolt_integrations.utils.lock import LockTimeout
+
+
+@pytest.fixture
+def pool(doltdb, tmpdir):
+    write_pandas(doltdb, "t", pd.DataFrame({"id": [1]}), primary_key=["id"])
+    doltdb.add("t")
+    doltdb.commit("Add t")
+    return ClonePool(doltdb.repo_dir, root=str(tmpdir.join("pool")), size=2)
+
+
+def test_pool_leases_distinct_clones(doltdb, pool):
+    with pool.lease() as first:
+        with pool.lease() as second:
+            assert first.repo_dir != second.repo_dir
+            assert first.head == second.head == doltdb.head
+            with pytest.raises(LockTimeout):
+                with pool.lease(timeout=0.2):
+                    pass
+
+    with pool.lease() as again:
+        assert again.repo_dir in (first.repo_dir, second.repo_dir)
+
+
+def test_pool_lease_blocks_across_threads(pool):
+    leased = []
+
+    def task():
+        with pool.lease() as db:
+            leased.append(db.repo_dir)
+
+    threads = [threading.Thread(target=task) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(leased) == 4 and len(set(leased)) <= 2
+
+
+def test_pool_reset_and_publish(doltdb, pool):
+    initial = doltdb.head
+    with pool.lease(publish=True) as db:
+        db.sql("insert into t values (2)")
+        db.add("t")
+        db.commit("Add 2")
+        published = db.head
+
+    assert doltdb.head == published
+    with pool.lease(commit=initial) as db:
+        assert db.head == initial
+        assert db.status().is_clean
+
+
+def test_pool_publish_diverged(doltdb, pool):
+    with pytest.raises(ValueError):
+        with pool.lease(publish=True) as db:
+            db.sql("insert into t values (2)")
+            db.add("t")
+            db.commit("Add 2 on the clone")
+
+            doltdb.sql("insert into t values (3)")
+            doltdb.add("t")
+            doltdb.commit("Add 3 on the source")
+            source_head = doltdb.head
+
+    assert doltdb.head == source_head
+    with pool.lease() as db:
+        assert db.head == source_head
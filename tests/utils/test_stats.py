@@ -0,0 +1,46 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from dolt_integrations.utils import ReadBudgetExceeded, table_stats, write_pandas
+from dolt_integrations.utils import stats as stats_module
+from dolt_integrations.utils.stats import STATS_DIR, check_read_budget
+
+
+@pytest.fixture
+def doltdb_with_table(doltdb):
+    df = pd.DataFrame({"id": [1, 2, 3, 4], "name": ["a", "bb", "ccc", None]})
+    write_pandas(doltdb, "t", df, primary_key=["id"])
+    doltdb.add("t")
+    doltdb.commit("Add t")
+    return doltdb
+
+
+def test_table_stats(doltdb_with_table):
+    stats = table_stats(doltdb_with_table, "t")
+    assert stats.commit == doltdb_with_table.head
+    assert stats.rows == 4
+    assert set(stats.column_types) == {"id", "name"}
+    # index and id at 8 bytes, name at the str overhead plus its mean length
+    assert stats.row_bytes == 8 * 2 + 49 + 2
+    assert stats.bytes == 4 * stats.row_bytes
+
+
+def test_table_stats_cached(doltdb_with_table):
+    stats = table_stats(doltdb_with_table, "t")
+    stats_dir = os.path.join(doltdb_with_table.repo_dir, ".dolt", STATS_DIR)
+    with open(os.path.join(stats_dir, f"t@{stats.commit}.json")) as f:
+        assert json.load(f) == stats.dict()
+
+    # another process starts with an empty memory cache
+    stats_module._cache.clear()
+    assert table_stats(doltdb_with_table, "t", stats.commit) == stats
+
+
+def test_check_read_budget(doltdb_with_table):
+    stats = table_stats(doltdb_with_table, "t")
+    check_read_budget(stats, stats.bytes)
+    with pytest.raises(ReadBudgetExceeded):
+        check_read_budget(stats, stats.bytes - 1)
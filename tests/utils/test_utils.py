@@ -0,0 +1,330 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dolt_integrations.utils import (
+    DtypePolicy,
+    asof_join,
+    read_numpy,
+    read_pandas,
+    read_pandas_sql,
+    write_pandas,
+)
+from dolt_integrations.utils.utils import (
+    aggregate_pandas_sql,
+    apply_dtype_policy,
+    get_asof_join_query,
+    get_create_table_sql,
+    get_dolt_type,
+    get_insert_sql,
+    insert_pandas,
+)
+
+
+def test_dolt_type_from_dtype():
+    df = pd.DataFrame(
+        {
+            "i8": np.array([1], dtype=np.int8),
+            "u32": np.array([1], dtype=np.uint32),
+            "i64": [1],
+            "nullable": pd.array([1], dtype="Int16"),
+            "f32": np.array([1.0], dtype=np.float32),
+            "f64": [1.0],
+            "flag": [True],
+            "ts": pd.to_datetime(["2021-01-01"]),
+            "name": ["abc"],
+        }
+    )
+    types = {col: get_dolt_type(df[col]) for col in df.columns}
+    assert types == {
+        "i8": "tinyint",
+        "u32": "int unsigned",
+        "i64": "bigint",
+        "nullable": "smallint",
+        "f32": "float",
+        "f64": "double",
+        "flag": "tinyint",
+        "ts": "datetime(6)",
+        "name": "longtext",
+    }
+
+
+def test_dolt_type_text_key():
+    assert get_dolt_type(pd.Series(["a", "b"]), is_key=True) == "varchar(255)"
+    assert get_dolt_type(pd.Series(["a" * 300]), is_key=True) == "varchar(300)"
+
+
+def test_create_table_sql():
+    df = pd.DataFrame({"id": ["a", "b"], "value": [1.5, None]})
+    sql = get_create_table_sql(
+        "t", df, ["id"], type_overrides={"value": "decimal(4,2)"}
+    )
+    assert sql == (
+        "CREATE TABLE `t` (\n"
+        "    `id` varchar(255) NOT NULL,\n"
+        "    `value` decimal(4,2),\n"
+        "    PRIMARY KEY (`id`)\n"
+        ");\n"
+    )
+
+
+def test_create_table_sql_unknown_override():
+    df = pd.DataFrame({"id": [1]})
+    with pytest.raises(ValueError):
+        get_create_table_sql("t", df, ["id"], type_overrides={"missing": "int"})
+
+
+def test_write_pandas_typed_create(doltdb):
+    df = pd.DataFrame(
+        {
+            "id": np.array([1, 2, None], dtype=object),
+            "small": np.array([1, 2, 3], dtype=np.int16),
+            "flag": [True, False, True],
+        }
+    ).astype({"id": "Int64"})
+    write_pandas(doltdb, "t", df, primary_key=["id"])
+
+    columns = doltdb.sql(
+        "select column_name as name, data_type as type from information_schema.columns where table_name = 't'",
+        result_format="csv",
+    )
+    types = {row["name"]: row["type"] for row in columns}
+    assert types == {"id": "bigint", "small": "smallint", "flag": "tinyint"}
+
+    res = read_pandas(doltdb, "t")
+    assert list(res.id) == [1, 2]
+    assert list(res.flag) == [1, 0]
+
+
+def test_insert_sql_batches():
+    df = pd.DataFrame(
+        {
+            "id": [1, 2, 3],
+            "name": ["it's", "a\\b", None],
+            "score": [1.5, np.nan, 2.0],
+            "flag": [True, False, True],
+        }
+    )
+    stmts = get_insert_sql("t", df, batch_size=2)
+    assert len(stmts) == 2
+    assert stmts[0].splitlines()[1:3] == [
+        "(1, 'it\\'s', 1.5, 1),",
+        "(2, 'a\\\\b', NULL, 0)",
+    ]
+    assert stmts[1].splitlines()[1] == "(3, NULL, 2.0, 1)"
+    assert stmts[1].startswith("INSERT INTO `t` (`id`, `name`, `score`, `flag`) VALUES")
+    assert "ON DUPLICATE KEY UPDATE `id` = VALUES(`id`)" in stmts[1]
+
+
+def test_insert_pandas_upsert(doltdb):
+    df = pd.DataFrame({"id": [1, 2], "name": ["it's", "b"]})
+    insert_pandas(doltdb, "t", df, primary_key=["id"])
+    insert_pandas(doltdb, "t", pd.DataFrame({"id": [2, 3], "name": ["c", "d"]}))
+
+    res = read_pandas_sql(doltdb, "select * from t order by id")
+    assert list(res.name) == ["it's", "c", "d"]
+
+    insert_pandas(doltdb, "t", df, import_mode="replace")
+    res = read_pandas_sql(doltdb, "select * from t order by id")
+    assert list(res.id) == [1, 2]
+    assert list(res.name) == ["it's", "b"]
+
+
+def test_insert_pandas_force_create(doltdb):
+    insert_pandas(doltdb, "t", pd.DataFrame({"id": [1, 2]}), primary_key=["id"])
+    with pytest.raises(ValueError):
+        insert_pandas(doltdb, "t", pd.DataFrame({"id": [3]}), import_mode="create")
+
+    df = pd.DataFrame({"id": [3], "name": ["c"]})
+    insert_pandas(doltdb, "t", df, import_mode="force_create", primary_key=["id"])
+    res = read_pandas_sql(doltdb, "select * from t")
+    assert res.to_dict("records") == [{"id": 3, "name": "c"}]
+
+
+def test_write_pandas_import_replace(doltdb):
+    df = pd.DataFrame({"id": [1, 2, 3], "name": ["a", "b", "c"]})
+    write_pandas(doltdb, "t", df, primary_key=["id"])
+    df = pd.DataFrame({"id": [1], "name": ["z"]})
+    write_pandas(doltdb, "t", df, import_mode="replace", max_insert_rows=0)
+    res = read_pandas_sql(doltdb, "select * from t")
+    assert res.to_dict("records") == [{"id": 1, "name": "z"}]
+
+
+def test_insert_pandas_missing_table(doltdb):
+    with pytest.raises(ValueError):
+        insert_pandas(doltdb, "t", pd.DataFrame({"id": [1]}), import_mode="replace")
+
+
+def test_asof_join_query():
+    sql = get_asof_join_query("labels", "features", ["id"], "ts", ["value"])
+    assert "FROM `labels` AS l" in sql
+    assert "WHERE date <= l.`ts`" in sql
+    assert "lc.*, h.`value`" in sql
+    assert "LEFT JOIN `dolt_history_features` AS h" in sql
+    assert "ON h.commit_hash = lc.asof_commit AND h.`id` = lc.`id`" in sql
+
+
+@pytest.fixture
+def asof_db(doltdb):
+    day = datetime.datetime(2021, 1, 1)
+    for i, values in enumerate([[10, 20], [11, 20], [12, 21]]):
+        df = pd.DataFrame({"id": [1, 2], "value": values})
+        mode = "create" if i == 0 else "replace"
+        write_pandas(doltdb, "features", df, primary_key=["id"], import_mode=mode)
+        doltdb.add("features")
+        doltdb.commit(f"day {i}", date=day + datetime.timedelta(days=i))
+
+    labels = pd.DataFrame(
+        {
+            "label_id": [1, 2, 3, 4],
+            "id": [1, 1, 2, 2],
+            "ts": pd.to_datetime(
+                [
+                    "2021-01-01 12:00",
+                    "2021-01-03 12:00",
+                    "2021-01-02 12:00",
+                    "2020-12-31",
+                ]
+            ),
+        }
+    )
+    write_pandas(doltdb, "labels", labels, primary_key=["label_id"])
+    return doltdb
+
+
+def test_asof_join_sql(asof_db):
+    res = asof_join(asof_db, "labels", "features", on=["id"], label_time="ts")
+    res = res.sort_values("label_id")
+    assert list(res.value.fillna(-1)) == [10, 12, 20, -1]
+    assert res.asof_commit.isna().tolist() == [False, False, False, True]
+
+
+def test_asof_join_pandas(asof_db):
+    res = asof_join(
+        asof_db, "labels", "features", on=["id"], label_time="ts", in_sql=False
+    )
+    res = res.sort_values("label_id")
+    assert list(res.value.fillna(-1)) == [10, 12, 20, -1]
+
+    chunked = asof_join(
+        asof_db, "labels", "features", ["id"], "ts", in_sql=False, chunksize=1
+    )
+    pd.testing.assert_frame_equal(chunked.sort_values("label_id"), res)
+
+
+def test_aggregate_pandas_sql_ungrouped(doltdb):
+    df = pd.DataFrame({"id": [1, 2, 3, 4, 5], "a": [1.0, None, 3.0, 4.0, 8.0]})
+    write_pandas(doltdb, "t", df, primary_key=["id"])
+    aggs = {
+        "n": ("a", "count"),
+        "total": ("a", "sum"),
+        "mean": ("a", "mean"),
+        "lo": ("a", "min"),
+        "hi": ("a", "max"),
+        "median": ("a", "median"),
+    }
+    res = aggregate_pandas_sql(doltdb, "select * from t", [], aggs, chunksize=2)
+    assert res.to_dict("records") == [
+        {"n": 4, "total": 16.0, "mean": 4.0, "lo": 1.0, "hi": 8.0, "median": 3.5}
+    ]
+
+
+def test_dtype_policy():
+    df = pd.DataFrame(
+        {
+            "id": np.arange(1000),
+            "state": ["CA", "NY"] * 500,
+            "name": [f"name{i}" for i in range(1000)],
+            "price": np.linspace(0, 1, 1000),
+            "count": [1.0, np.nan] * 500,
+        }
+    )
+    before = df.memory_usage(deep=True).sum()
+    apply_dtype_policy(
+        df,
+        DtypePolicy(float32=True, string_storage="python"),
+        column_types={"count": "int unsigned"},
+    )
+    assert df.dtypes.astype(str).to_dict() == {
+        "id": "Int16",
+        "state": "category",
+        "name": "string",
+        "price": "float32",
+        "count": "UInt8",
+    }
+    assert df.attrs["memory_saved"] == before - df.memory_usage(deep=True).sum() > 0
+
+
+def test_read_pandas_dtypes(doltdb):
+    df = pd.DataFrame({"id": [1, 2, 3], "small": [1, None, 3], "tag": ["a", "a", "a"]})
+    write_pandas(
+        doltdb, "t", df, primary_key=["id"], type_overrides={"small": "tinyint"}
+    )
+
+    res = read_pandas(doltdb, "t", dtypes=DtypePolicy())
+    assert res.dtypes.astype(str).to_dict() == {
+        "id": "Int8",
+        "small": "Int8",
+        "tag": "category",
+    }
+    assert res.small.isna().tolist() == [False, True, False]
+
+
+def test_read_pandas_dtypes_as_of(doltdb):
+    df = pd.DataFrame({"id": [1, 2, 3], "small": [1, None, 3]})
+    write_pandas(
+        doltdb, "t", df, primary_key=["id"], type_overrides={"small": "tinyint"}
+    )
+    doltdb.add("t")
+    doltdb.commit("Add t")
+    commit = doltdb.head
+    doltdb.sql("alter table t modify small double")
+    doltdb.add("t")
+    doltdb.commit("Widen small")
+
+    res = read_pandas(doltdb, "t", as_of=commit, dtypes=DtypePolicy())
+    assert res.dtypes.astype(str).to_dict()["small"] == "Int8"
+
+
+def test_read_numpy(doltdb):
+    df = pd.DataFrame(
+        {
+            "id": np.arange(2500),
+            "score": np.arange(2500) * 0.5,
+            "name": ["a", "b"] * 1250,
+        }
+    )
+    write_pandas(doltdb, "t", df, primary_key=["id"])
+
+    res = read_numpy(
+        doltdb,
+        "select * from t order by id",
+        dtypes={"id": np.int32, "name": "U1"},
+        chunksize=1000,
+    )
+    assert {col: arr.dtype for col, arr in res.items()} == {
+        "id": np.int32,
+        "score": np.float64,
+        "name": np.dtype("U1"),
+    }
+    np.testing.assert_array_equal(res["id"], df.id)
+    np.testing.assert_array_equal(res["score"], df.score)
+    assert res["name"][:3].tolist() == ["a", "b", "a"]
+    empty = read_numpy(doltdb, "select * from t where id < 0")
+    assert all(len(arr) == 0 for arr in empty.values())
+
+
+def test_read_numpy_promotes(doltdb):
+    df = pd.DataFrame(
+        {"id": [1, 2, 3], "value": [1.0, 2.0, None], "name": ["a", "bb", "ccc"]}
+    )
+    write_pandas(doltdb, "t", df, primary_key=["id"])
+
+    res = read_numpy(
+        doltdb, "select * from t order by id", dtypes={"name": "U"}, chunksize=1
+    )
+    assert res["value"].dtype == np.float64
+    np.testing.assert_array_equal(res["value"], [1.0, 2.0, np.nan])
+    assert res["name"].tolist() == ["a", "bb", "ccc"]